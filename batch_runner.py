@@ -0,0 +1,268 @@
+import argparse
+import configparser
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import graph_io
+import graph_ops
+import main_worker_file as mwf
+
+# sections that change the graph of a run; output, caching, the worker count of [PARALLEL] and the
+# other modes do not enter the key
+RESULT_SECTIONS = ['SCENARIO', 'STREET', 'BUILDING', 'ROUTER', 'CONTENT', 'MONTECARLO', 'SINR', 'CITYGRID']
+# bump when the pipeline changes what a stored result holds
+STORE_VERSION = 3
+
+def normalize_value(value):
+
+    """
+    :param value: raw configuration value
+    :return: canonical string, so that '20', '20.0' and ' 20' (or 'yes' and 'True') give the same key
+    """
+    value = value.strip()
+    try:
+        return repr(float(value))
+    except ValueError:
+        pass
+    if value.lower() in configparser.ConfigParser.BOOLEAN_STATES:
+        return str(configparser.ConfigParser.BOOLEAN_STATES[value.lower()])
+    return value
+
+def result_sections(config):
+
+    """
+    :param config: parsed configuration
+    :return: dictionary section -> {key: value} of the sections in RESULT_SECTIONS
+    """
+    return {section: dict(config.items(section)) for section in RESULT_SECTIONS if config.has_section(section)}
+
+def normalize_config(config):
+
+    """
+    :param config: parsed configuration
+    :return: dictionary section -> {key: canonical value} of the sections in RESULT_SECTIONS
+    """
+    return {section: {key: normalize_value(value) for key, value in items.items()}
+            for section, items in result_sections(config).items()}
+
+def result_key(params):
+
+    """
+    :param params: normalized parameters of normalize_config
+    :return: sha256 hex digest of the parameters, the address of their result in the store
+    """
+    text = json.dumps({'version': STORE_VERSION, 'params': params}, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ResultStore(object):
+
+    """
+    On-disk results addressed by result_key. Every entry is a directory holding
+    params.json, summary.json, one graph_<scenario>.npz per scenario and, when the
+    pipeline keeps it, the condensed link capacity as capacity_<scenario>.npy.
+    Entries are written to a temporary directory and renamed into place, so a
+    reader never sees a partial result.
+    """
+
+    def __init__(self, root):
+
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+
+        """
+        :return: summary of the stored result, None on a miss
+        """
+        try:
+            with open(os.path.join(self.path(key), 'summary.json')) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def put(self, key, params, summary, graphs, capacities):
+
+        """
+        :param graphs: dictionary scenario -> CSR adjacency matrix
+        :param capacities: dictionary scenario -> CondensedMatrix of the link capacity (may be empty)
+        """
+        final = self.path(key)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(final), prefix='.tmp-')
+        try:
+            with open(os.path.join(tmp, 'params.json'), 'w') as f:
+                json.dump(params, f, indent=1, sort_keys=True)
+            for scenario, adj in graphs.items():
+                graph_io.save_graph(os.path.join(tmp, 'graph_{}.npz'.format(scenario)), adj, metadata={'Scenario': scenario})
+            for scenario, l_mat in capacities.items():
+                np.save(os.path.join(tmp, 'capacity_{}.npy'.format(scenario)), l_mat.data)
+            with open(os.path.join(tmp, 'summary.json'), 'w') as f:
+                json.dump(summary, f, indent=1, sort_keys=True)
+            try:
+                os.rename(tmp, final)
+            except OSError:
+                # the same key was stored concurrently, keep the first copy
+                shutil.rmtree(tmp)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def load_graph(self, key, scenario, mmap=False):
+
+        """
+        :return: (CSR adjacency matrix, metadata) of a stored scenario
+        """
+        return graph_io.load_graph(os.path.join(self.path(key), 'graph_{}.npz'.format(scenario)), mmap=mmap)
+
+    def load_capacity(self, key, scenario, mmap=True):
+
+        """
+        :return: condensed link capacity vector of a stored scenario, None if it was not kept
+        """
+        path = os.path.join(self.path(key), 'capacity_{}.npy'.format(scenario))
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode='r' if mmap else None)
+
+def read_jobs(jobs_path, base_path='config.ini'):
+
+    """
+    :param jobs_path: text file with one job per line; a line lists .ini files read on top of the
+                      base configuration and/or SECTION.Key=Value overrides. Blank lines and lines
+                      starting with # are skipped
+    :param base_path: configuration every job starts from
+    :return: list of parsed configurations, one per job
+    """
+    configs = []
+    with open(jobs_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            config = configparser.ConfigParser()
+            config.read(base_path)
+            tokens = shlex.split(line)
+            config.read([t for t in tokens if '=' not in t])
+            mwf.apply_overrides(config, [t for t in tokens if '=' in t])
+            configs.append(config)
+    return configs
+
+def summarize_graph(adj):
+
+    """
+    :return: JSON-ready statistics of an adjacency matrix
+    """
+    info = graph_ops.analyze_adjacency(adj)
+    return {'nodes': int(adj.shape[0]), 'edges': int(adj.nnz // 2), 'average_degree': float(info['average_degree']),
+            'n_components': int(info['n_components']), 'is_connected': bool(info['is_connected']),
+            'giant_component_size': int(info['giant_component_size'])}
+
+def evaluate_job(sections, store_root):
+
+    """
+    Runs one configuration in the single-run mode of main_worker_file and stores it.
+    The shadowing is seeded from [MONTECARLO] Seed, so a key always maps to the same result.
+
+    :param sections: result_sections of the configuration
+    :param store_root: directory of the ResultStore
+    :return: summary dictionary scenario -> statistics
+    """
+    config = configparser.ConfigParser()
+    config.read_dict(sections)
+    params = normalize_config(config)
+    graphs, capacities, summary = {}, {}, {}
+    for scenario, key in (('singlehouse', 'SingleHouse'), ('apartment', 'Apartment')):
+        if config.getboolean('SCENARIO', key, fallback=False):
+            # the store keeps CSR graphs, whatever the storage of the single runs
+            adj, l_mat = mwf.build_scenario_graph(config, scenario, storage='sparse')
+            graphs[scenario] = adj
+            if l_mat is not None:
+                capacities[scenario] = l_mat
+            summary[scenario] = summarize_graph(adj)
+    ResultStore(store_root).put(result_key(params), params, summary, graphs, capacities)
+    return summary
+
+def check_job(config, index=0):
+
+    """
+    :param config: parsed configuration of a job
+    :param index: job number, used in the message
+    :return: exits if the job selects a mode whose result is not the single-run graph of
+             main_worker_file.build_scenario_graph, which is all the store holds, or if it has
+             no [MONTECARLO] Seed, as an unseeded draw cannot be served again under its key
+    """
+    if config.getboolean('SCENARIO', 'CityGrid', fallback=False):
+        sys.exit("Job {}: the batch runner does not support CityGrid runs".format(index))
+    if config.getint('MONTECARLO', 'Realizations', fallback=0) > 0:
+        sys.exit("Job {}: the batch runner does not support Monte Carlo runs (Realizations > 0)".format(index))
+    if config.getint('STREAMING', 'TileSize', fallback=0) > 0:
+        sys.exit("Job {}: the batch runner does not support tiled runs (TileSize > 0)".format(index))
+    for section, key, mode in (('SOLVER', 'Solve', 'link budget solver'), ('CURVE', 'Output', 'threshold curve'),
+                               ('WIDESTPATH', 'Output', 'widest path')):
+        if config.get(section, key, fallback='').strip():
+            sys.exit("Job {}: the batch runner does not support {} runs ([{}] {})".format(index, mode, section, key))
+    if not config.get('MONTECARLO', 'Seed', fallback='').strip():
+        sys.exit("Job {}: the batch runner needs a [MONTECARLO] Seed, unseeded results cannot be stored".format(index))
+
+def run_jobs(configs, store, workers=None):
+
+    """
+    :param configs: list of parsed configurations
+    :param store: ResultStore
+    :param workers: number of worker processes for the misses
+    :return: generator of (job index, key, summary, True if served from the store), hits first,
+             then the misses in the order they finish. Jobs with the same key are computed once
+    """
+    for index, config in enumerate(configs):
+        check_job(config, index)
+    keys = [result_key(normalize_config(config)) for config in configs]
+    pending = {}
+    for index, key in enumerate(keys):
+        summary = store.get(key)
+        if summary is not None:
+            yield index, key, summary, True
+        else:
+            pending.setdefault(key, []).append(index)
+    if not pending:
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(evaluate_job, result_sections(configs[indices[0]]), store.root): key
+                   for key, indices in pending.items()}
+        for fut in as_completed(futures):
+            key = futures[fut]
+            summary = fut.result()
+            for index in pending[key]:
+                yield index, key, summary, False
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Run many configurations, reusing the stored results")
+    parser.add_argument('jobs', help="file with one job per line (.ini files and/or SECTION.Key=Value overrides)")
+    parser.add_argument('--config', default='config.ini', help="base configuration of every job")
+    parser.add_argument('--store', default='results', help="directory of the result store")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes for the jobs not in the store")
+    args = parser.parse_args(argv)
+    configs = read_jobs(args.jobs, args.config)
+    store = ResultStore(args.store)
+    done = 0
+    for index, key, summary, hit in run_jobs(configs, store, workers=args.workers):
+        done += 1
+        stats = ", ".join("{} degree {:.2f} connected {}".format(s, v['average_degree'], v['is_connected'])
+                          for s, v in summary.items())
+        print("[{}/{}] job {} {} {}: {}".format(done, len(configs), index, key[:12], 'stored' if hit else 'computed', stats))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+
+    main()
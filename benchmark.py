@@ -0,0 +1,201 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import coordinates
+import graph_ops
+import wireless_apartments as wa
+import wireless_singlehouse as ws
+from condensed import CondensedMatrix
+
+STAGES = ['coordinates', 'distance', 'intersection', 'pathloss', 'capacity', 'edges', 'graph_analysis']
+# fields of a result that hold seconds of this machine, left out of the stored baseline
+ABSOLUTE_TIME_FIELDS = ('time', 'total_time')
+
+def measure_stage(func, *args, trace_memory=False):
+
+    """
+    :param func: stage to run
+    :param trace_memory: if True, the peak memory of the stage is traced with tracemalloc instead of
+                         timing it, as tracing slows down allocation-heavy numpy code
+    :return: (result of func, wall time in seconds, or peak traced memory in bytes if trace_memory)
+    """
+    if trace_memory:
+        tracemalloc.reset_peak()
+        base_mem = tracemalloc.get_traced_memory()[0]
+        result = func(*args)
+        return result, tracemalloc.get_traced_memory()[1] - base_mem
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def benchmark_pipeline(scenario, bn, nf, sw=20, bw=7, fh=3.5, txp=20, thr=0.0005, seed=1, trace_memory=False):
+
+    """
+    :param scenario: 'apartment' or 'singlehouse'
+    :param bn: number of buildings (including both sides of the road)
+    :param nf: number of floors in each building (1 for single houses)
+    :param trace_memory: if True, the peak memory of every stage is measured instead of its time
+                         (tracemalloc must be tracing)
+    :return: dictionary stage -> seconds (or bytes if trace_memory), plus the node and edge counts
+    """
+    stages = {}
+    allc, stages['coordinates'] = measure_stage(coordinates.get_all_coordinates, sw, bw, bn, nf, fh, trace_memory=trace_memory)
+    dist, stages['distance'] = measure_stage(coordinates.get_condensed_distance_matrix, allc, trace_memory=trace_memory)
+    ints, stages['intersection'] = measure_stage(coordinates.get_condensed_intersection_matrix, bn, nf, trace_memory=trace_memory)
+    if scenario == 'singlehouse':
+        pathloss, value = measure_stage(ws.calculate_pathloss_for_residential_area, dist.data, ints.data,
+                                        trace_memory=trace_memory)
+        pathloss = CondensedMatrix(pathloss, dist.n)
+    else:
+        pathloss, value = measure_stage(wa.calculate_condensed_mean_pathloss, dist, ints, nf, trace_memory=trace_memory)
+        shadow, value2 = measure_stage(wa.draw_condensed_shadowing, dist.n, seed, nf, trace_memory=trace_memory)
+        pathloss.data += shadow.data
+        value = max(value, value2) if trace_memory else value + value2
+        del shadow
+    stages['pathloss'] = value
+    del dist, ints
+    capacity, stages['capacity'] = measure_stage(wa.calculate_link_capacity_matrix, pathloss, txp, trace_memory=trace_memory)
+    del pathloss
+    adj, stages['edges'] = measure_stage(graph_ops.condensed_to_adjacency, capacity, thr, trace_memory=trace_memory)
+    del capacity
+    info, stages['graph_analysis'] = measure_stage(graph_ops.analyze_adjacency, adj, trace_memory=trace_memory)
+    return {'scenario': scenario, 'bn': bn, 'nf': nf, 'nodes': bn * nf, 'edges': adj.nnz // 2, 'stages': stages}
+
+def calibrate(size=2**20, repeat=5):
+
+    """
+    :param size: number of values of the reference workload
+    :param repeat: number of runs, the fastest is kept
+    :return: wall time in seconds of a fixed numpy workload (log10, sqrt and sort of size values),
+             the unit of the relative times, so that runs on different machines can be compared
+    """
+    values = np.random.default_rng(0).random(size)
+    best = float('inf')
+    for r in range(repeat):
+        start = time.perf_counter()
+        np.sort(np.sqrt(np.log10(values + 1)))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run_benchmarks(building_counts, floor_counts, max_nodes, repeat=1):
+
+    """
+    :param building_counts: building counts to sweep
+    :param floor_counts: floor counts to sweep (the single-house scenario is always run with 1 floor)
+    :param max_nodes: configurations with more nodes are skipped
+    :param repeat: number of timed runs per configuration, the fastest run of every stage is kept.
+                   The peak memory comes from one more run under tracemalloc, which is not timed
+    :return: (list of benchmark results, time unit of calibrate in seconds); every stage has its
+             time, its relative_time (time / unit) and its peak_memory
+    """
+    configs = [('singlehouse', bn, 1) for bn in building_counts]
+    configs += [('apartment', bn, nf) for bn in building_counts for nf in floor_counts]
+    unit = calibrate()
+    results = []
+    for (scenario, bn, nf) in configs:
+        if bn * nf > max_nodes:
+            continue
+        runs = [benchmark_pipeline(scenario, bn, nf) for r in range(repeat)]
+        tracemalloc.start()
+        try:
+            traced = benchmark_pipeline(scenario, bn, nf, trace_memory=True)
+        finally:
+            tracemalloc.stop()
+        best = {key: runs[0][key] for key in ('scenario', 'bn', 'nf', 'nodes', 'edges')}
+        best['stages'] = {}
+        for stage in STAGES:
+            t = min(run['stages'][stage] for run in runs)
+            best['stages'][stage] = {'time': t, 'relative_time': t / unit, 'peak_memory': traced['stages'][stage]}
+        best['total_time'] = sum(best['stages'][s]['time'] for s in STAGES)
+        best['relative_total_time'] = best['total_time'] / unit
+        print("{:12s} bn={:6d} nf={:2d} nodes={:7d} total {:8.4f} s  ".format(scenario, bn, nf, bn * nf, best['total_time'])
+              + " ".join("{}={:.4f}".format(s, best['stages'][s]['time']) for s in STAGES))
+        results.append(best)
+    return results, unit
+
+def get_baseline_results(results):
+
+    """
+    :param results: list of benchmark results of run_benchmarks
+    :return: copy of the results without the absolute times, which only hold on this machine
+    """
+    baseline = []
+    for res in results:
+        base = {key: value for key, value in res.items() if key not in ABSOLUTE_TIME_FIELDS}
+        base['stages'] = {stage: {key: value for key, value in values.items() if key not in ABSOLUTE_TIME_FIELDS}
+                          for stage, values in res['stages'].items()}
+        baseline.append(base)
+    return baseline
+
+def compare_with_baseline(results, baseline, tolerance, min_relative_time=1.0, min_memory=2**20):
+
+    """
+    :param results: list of benchmark results of this run
+    :param baseline: list of benchmark results of the stored baseline
+    :param tolerance: a stage regresses when it is more than this factor slower (or bigger) than the baseline
+    :param min_relative_time: stages faster than this (in calibrate units) in the baseline are not compared on time
+    :param min_memory: stages using less than this (in bytes) in the baseline are not compared on memory
+    :return: list of regression messages, times are compared relative to the calibrate unit of each run
+    """
+    base_index = {(b['scenario'], b['bn'], b['nf']): b for b in baseline}
+    regressions = []
+    for res in results:
+        key = (res['scenario'], res['bn'], res['nf'])
+        if key not in base_index:
+            continue
+        for stage in STAGES:
+            new = res['stages'][stage]
+            old = base_index[key]['stages'][stage]
+            if old['relative_time'] >= min_relative_time and new['relative_time'] > tolerance * old['relative_time']:
+                regressions.append("{} bn={} nf={} {}: relative time {:.3f} -> {:.3f}".format(*key, stage, old['relative_time'],
+                                                                                             new['relative_time']))
+            if old['peak_memory'] >= min_memory and new['peak_memory'] > tolerance * old['peak_memory']:
+                regressions.append("{} bn={} nf={} {}: peak memory {} -> {} bytes".format(*key, stage, old['peak_memory'], new['peak_memory']))
+    return regressions
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the link capacity pipeline")
+    parser.add_argument('--buildings', type=int, nargs='+', default=[10, 100, 1000], help="building counts to sweep")
+    parser.add_argument('--floors', type=int, nargs='+', default=[1, 4, 8], help="floor counts to sweep")
+    parser.add_argument('--max-nodes', type=int, default=4000, help="skip configurations with more nodes")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per configuration, fastest kept")
+    parser.add_argument('--output', default='benchmark_results.json', help="machine-readable results file")
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help="stored baseline to compare against")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="allowed slow-down factor before a regression is reported")
+    parser.add_argument('--update-baseline', action='store_true', help="store this run as the new baseline")
+    args = parser.parse_args(argv)
+
+    results, unit = run_benchmarks(args.buildings, args.floors, args.max_nodes, args.repeat)
+    report = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+              'time_unit': unit, 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print("Results written to {} (time unit {:.4f} s)".format(args.output, unit))
+    if args.update_baseline:
+        baseline = {'python': report['python'], 'numpy': report['numpy'], 'results': get_baseline_results(results)}
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1)
+        print("Baseline updated: {}".format(args.baseline))
+        return 0
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    except FileNotFoundError:
+        print("No baseline found at {}, run with --update-baseline to create one".format(args.baseline))
+        return 0
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    for msg in regressions:
+        print("REGRESSION " + msg)
+    if not regressions:
+        print("No regressions against {}".format(args.baseline))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import numpy as np
+from scipy import sparse
+import instrumentation
+from condensed import condensed_index, condensed_size
+
+if hasattr(np, 'bitwise_count'):
+    popcount = np.bitwise_count
+else:
+    # numpy < 2.0 has no popcount ufunc, a table of the 256 byte values does the same
+    _BYTE_COUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+    def popcount(a):
+
+        return _BYTE_COUNTS[a]
+
+class BitAdjacency(object):
+
+    """
+    Unweighted symmetric adjacency matrix of n nodes stored as bits, one np.packbits row
+    of ceil(n/8) bytes per node. It takes n*n/8 bytes whatever the number of edges, so
+    it is smaller than CSR (one index of 4 bytes and one value per edge and direction)
+    once a few percent of the pairs are linked, as in apartment graphs at high TxPower
+    and low bitrate, which come close to complete graphs.
+
+    Degrees are popcounts of the rows, the neighbours of a node are its unpacked row and
+    connected components are found by a BFS that ORs the rows of the whole frontier.
+    """
+
+    def __init__(self, bits, n):
+
+        bits = np.asarray(bits, dtype=np.uint8)
+        if bits.shape != (n, (n + 7) // 8):
+            raise ValueError("bit rows of {} nodes must have shape {}, got {}".format(n, (n, (n + 7) // 8), bits.shape))
+        self.bits = bits
+        self.n = n
+
+    @property
+    def shape(self):
+
+        return (self.n, self.n)
+
+    @property
+    def nbytes(self):
+
+        return self.bits.nbytes
+
+    def __len__(self):
+
+        return self.n
+
+    def get_block_rows(self, max_values=2**20):
+
+        """
+        :param max_values: upper bound on the number of unpacked values in one block (at least one row)
+        :return: number of rows unpacked at once, so that temporary arrays stay bounded
+        """
+        return max(1, max_values // max(self.n, 1))
+
+    def degrees(self):
+
+        """
+        :return: degree of every node, the popcount of its row
+        """
+        return popcount(self.bits).sum(axis=1, dtype=np.int64)
+
+    @property
+    def n_edges(self):
+
+        return int(self.degrees().sum() // 2)
+
+    def neighbors(self, i):
+
+        """
+        :param i: node id
+        :return: sorted node ids linked to node i
+        """
+        return np.flatnonzero(np.unpackbits(self.bits[i], count=self.n))
+
+    def iter_neighbors(self):
+
+        """
+        :return: generator of (i, neighbors(i)) for every node, unpacking a block of rows at a time
+        """
+        step = self.get_block_rows()
+        for r0 in range(0, self.n, step):
+            block = np.unpackbits(self.bits[r0:r0 + step], axis=1, count=self.n)
+            for offset, row in enumerate(block):
+                yield r0 + offset, np.flatnonzero(row)
+
+    def reach(self, frontier):
+
+        """
+        :param frontier: node ids
+        :return: packed row of the nodes linked to at least one node of the frontier
+        """
+        out = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        step = self.get_block_rows()
+        for f0 in range(0, len(frontier), step):
+            out |= np.bitwise_or.reduce(self.bits[frontier[f0:f0 + step]], axis=0)
+        return out
+
+    def connected_components(self):
+
+        """
+        :return: (number of connected components, component label of every node), found by
+                 breadth-first search on the packed rows: each level ORs the rows of the frontier
+                 and keeps the bits not visited yet, so a component of m nodes costs m row reads
+        """
+        labels = np.full(self.n, -1, dtype=np.int32)
+        visited = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        n_components = 0
+        for start in range(self.n):
+            if labels[start] >= 0:
+                continue
+            labels[start] = n_components
+            visited[start >> 3] |= np.uint8(0x80 >> (start & 7))
+            frontier = np.array([start])
+            while len(frontier) > 0:
+                new = self.reach(frontier) & ~visited
+                visited |= new
+                frontier = np.flatnonzero(np.unpackbits(new, count=self.n))
+                labels[frontier] = n_components
+            n_components += 1
+        return n_components, labels
+
+    def upper_pairs(self):
+
+        """
+        :return: node ids (src, dst) with src < dst of every edge, in condensed (row-major) order
+        """
+        src, dst = [], []
+        step = self.get_block_rows()
+        cols = np.arange(self.n, dtype=np.int32)
+        for r0 in range(0, self.n, step):
+            block = np.unpackbits(self.bits[r0:r0 + step], axis=1, count=self.n).astype(bool)
+            block &= cols[None, :] > np.arange(r0, r0 + len(block), dtype=np.int32)[:, None]
+            rows, cols_block = np.nonzero(block)
+            src.append((rows + r0).astype(np.int32))
+            dst.append(cols_block.astype(np.int32))
+        if not src:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        return np.concatenate(src), np.concatenate(dst)
+
+    def to_sparse(self, weights=None):
+
+        """
+        :param weights: optional CondensedMatrix of the edge weights (e.g. the link capacities)
+        :return: symmetric scipy.sparse CSR adjacency matrix, holding the weights of the edges
+                 or 1 for every edge if weights is None
+        """
+        src, dst = self.upper_pairs()
+        if weights is None:
+            data = np.ones(len(src), dtype=np.int8)
+        else:
+            data = weights.data[condensed_index(self.n, src, dst)]
+        rows = np.concatenate((src, dst))
+        cols = np.concatenate((dst, src))
+        return sparse.csr_matrix((np.concatenate((data, data)), (rows, cols)), shape=(self.n, self.n))
+
+@instrumentation.instrument('edges', count=lambda adj: 2 * adj.n_edges)
+def condensed_to_bit_adjacency(cmat, threshold, max_values=2**20):
+
+    """
+    :param cmat: CondensedMatrix of the link capacities
+    :param threshold: it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :param max_values: upper bound on the number of pairs gathered at once
+    :return: BitAdjacency of the links whose capacity exceeds the threshold, built a block of
+             rows at a time so that no n x n array of booleans is allocated
+    """
+    n = cmat.n
+    bits = np.zeros((n, (n + 7) // 8), dtype=np.uint8)
+    if condensed_size(n) == 0:
+        return BitAdjacency(bits, n)
+    step = max(1, max_values // n)
+    cols = np.arange(n)[None, :]
+    for r0 in range(0, n, step):
+        rows = np.arange(r0, min(r0 + step, n))[:, None]
+        same = rows == cols
+        k = condensed_index(n, np.where(same, 0, rows), np.where(same, 1, cols))
+        mask = cmat.data[k] > threshold
+        mask[same] = False
+        bits[r0:r0 + len(rows)] = np.packbits(mask, axis=1)
+    return BitAdjacency(bits, n)
+
+def sparse_to_bit_adjacency(adj, max_values=2**20):
+
+    """
+    :param adj: symmetric scipy.sparse adjacency matrix
+    :param max_values: upper bound on the number of values made dense at once
+    :return: BitAdjacency with a bit for every stored entry off the diagonal
+    """
+    adj = sparse.csr_matrix(adj)
+    n = adj.shape[0]
+    bits = np.zeros((n, (n + 7) // 8), dtype=np.uint8)
+    step = max(1, max_values // max(n, 1))
+    for r0 in range(0, n, step):
+        block = adj[r0:r0 + step].toarray() != 0
+        block[np.arange(len(block)), np.arange(r0, r0 + len(block))] = False
+        bits[r0:r0 + len(block)] = np.packbits(block, axis=1)
+    return BitAdjacency(bits, n)
@@ -0,0 +1,242 @@
+import sys
+import numpy as np
+import geometry_cache as gcache
+import graph_ops
+import instrumentation
+import range_pruning as rp
+import shadowing
+import wireless_apartments as wa
+import wireless_singlehouse as ws
+from condensed import condensed_to_pairs
+
+def get_grid_segments(n_streets, n_avenues, block, sw, bw):
+
+    """
+    Street segments of a grid of n_streets horizontal and n_avenues vertical streets, with
+    one row of buildings on each side of every segment between two crossings. Streets are
+    block + sw apart (center to center), so a city block is block x block meters. The
+    corners of a city block belong to the rows of the horizontal streets.
+
+    :param n_streets: number of horizontal streets
+    :param n_avenues: number of vertical streets
+    :param block: side of a city block between two streets (in meter)
+    :param sw: width of the street (in meter)
+    :param bw: width of a single building (in meter), buildings are bw x bw squares
+    :return: list of (orientation, street center, start along the street, buildings on each side),
+             orientation 0 for horizontal and 1 for vertical segments
+    """
+    pitch = block + sw
+    m_h = int(block // bw)
+    m_v = int((block - 2 * bw) // bw)
+    if n_streets < 1 or n_avenues < 1 or m_h < 1:
+        sys.exit("The city grid needs at least one street, one avenue and one building per segment")
+    segments = []
+    for j in range(n_streets):
+        for i in range(n_avenues - 1):
+            segments.append((0, j * pitch, i * pitch + sw / 2.0, m_h))
+    if m_v > 0:
+        for i in range(n_avenues):
+            for j in range(n_streets - 1):
+                segments.append((1, i * pitch, j * pitch + sw / 2.0 + bw, m_v))
+    if not segments:
+        # a segment lies between two crossings, so one street and one avenue have none
+        sys.exit("The city grid needs two streets or two avenues to have a street segment")
+    return segments
+
+@instrumentation.instrument('coordinates', count=lambda layout: len(layout['crds']))
+def get_grid_layout(n_streets, n_avenues, block, sw, bw, nf, fh):
+
+    """
+    :return: dictionary with
+        crds - (n, 3) coordinates of the nodes
+        building - building id of every node
+        segment - segment id of every node
+        footprints - (number of buildings, 4) footprint x0, y0, x1, y1 of every building
+        segments - list of (first node id, buildings on each side) of every segment
+    Inside a segment the nodes are numbered like coordinates.get_all_coordinates, so a segment
+    is the single street of that module with 2 * buildings on each side in total.
+    (the parameters are those of get_grid_segments, plus nf floors of height fh)
+    """
+    crds, building, segment, footprints, segments = [], [], [], [], []
+    node0, building0 = 0, 0
+    for seg_id, (orient, center, start, m) in enumerate(get_grid_segments(n_streets, n_avenues, block, sw, bw)):
+        side = np.repeat([-1.0, 1.0], m * nf)
+        pos = np.tile(np.repeat(np.arange(m), nf), 2)
+        floor = np.tile(np.arange(nf), 2 * m)
+        along = start + (pos + 0.5) * bw
+        across = center + side * (sw + bw) / 2.0
+        xy = (along, across) if orient == 0 else (across, along)
+        crds.append(np.column_stack(xy + (floor * float(fh),)))
+        building.append(building0 + np.arange(2 * m * nf) // nf)
+        segment.append(np.full(2 * m * nf, seg_id))
+        b_along = start + np.arange(m) * bw
+        for s in (-1.0, 1.0):
+            lo = center + sw / 2.0 if s > 0 else center - sw / 2.0 - bw
+            rect = [b_along, np.full(m, lo), b_along + bw, np.full(m, lo + bw)]
+            footprints.append(np.column_stack(rect if orient == 0 else [rect[1], rect[0], rect[3], rect[2]]))
+        segments.append((node0, m))
+        node0 += 2 * m * nf
+        building0 += 2 * m
+    layout = {}
+    layout['crds'] = np.concatenate(crds)
+    layout['building'] = np.concatenate(building)
+    layout['segment'] = np.concatenate(segment)
+    layout['footprints'] = np.concatenate(footprints)
+    layout['segments'] = segments
+    return layout
+
+def _slab(p, d, lo, hi):
+
+    # entry and exit parameter of the line p + t * d through lo < x < hi
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (lo - p) / d
+        t2 = (hi - p) / d
+    parallel = d == 0
+    inside = (p > lo) & (p < hi)
+    t_in = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+    t_out = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+    return t_in, t_out
+
+@instrumentation.instrument('intersection', count=len)
+def count_building_crossings(p, q, footprints, own_p, own_q, max_elements=2**16):
+
+    """
+    :param p: (k, 2) first end of each line of sight
+    :param q: (k, 2) second end of each line of sight
+    :param footprints: (number of buildings, 4) footprint x0, y0, x1, y1 of every building
+    :param own_p: building of the first end, not counted
+    :param own_q: building of the second end, not counted
+    :param max_elements: upper bound on the line x building tests evaluated at once
+    :return: number of buildings whose footprint each line of sight crosses
+
+    Lines are tested in chunks against the buildings that overlap the bounding box of the
+    chunk, so nearby lines (e.g. sorted by building) only meet the buildings around them.
+    """
+    counts = np.zeros(len(p), dtype=np.int32)
+    step = max(1, int(np.sqrt(max_elements)))
+    for s in range(0, len(p), step):
+        e = min(len(p), s + step)
+        lo = np.minimum(p[s:e].min(axis=0), q[s:e].min(axis=0))
+        hi = np.maximum(p[s:e].max(axis=0), q[s:e].max(axis=0))
+        cand = np.flatnonzero((footprints[:, 0] < hi[0]) & (footprints[:, 2] > lo[0]) &
+                              (footprints[:, 1] < hi[1]) & (footprints[:, 3] > lo[1]))
+        x0, y0, x1, y1 = (footprints[cand, c][None, :] for c in range(4))
+        px, py = p[s:e, 0:1], p[s:e, 1:2]
+        dx, dy = q[s:e, 0:1] - px, q[s:e, 1:2] - py
+        tx_in, tx_out = _slab(px, dx, x0, x1)
+        ty_in, ty_out = _slab(py, dy, y0, y1)
+        t_in = np.maximum(tx_in, ty_in)
+        t_out = np.minimum(tx_out, ty_out)
+        hit = (t_in < t_out) & (t_in < 1) & (t_out > 0)
+        hit &= (cand[None, :] != own_p[s:e, None]) & (cand[None, :] != own_q[s:e, None])
+        counts[s:e] = hit.sum(axis=1)
+    return counts
+
+def segment_links(scenario, layout, sw, bw, nf, fh, txp, thr, key, cache=None, max_pairs=2**22):
+
+    """
+    Links inside the street segments. Segments with the same number of buildings share
+    the cached mean pathloss of their single-street geometry, and each group is evaluated
+    as one (segments x pairs) block. The shadowing of a pair is drawn for its global node
+    ids (wireless_apartments.pair_shadowing), so every segment gets its own values.
+
+    :return: (src, dst, capacity) of the links above thr, in global node ids
+    """
+    srcs, dsts, caps = [], [], []
+    n_nodes = len(layout['crds'])
+    starts = np.array([node0 for node0, m in layout['segments']])
+    sizes = np.array([m for node0, m in layout['segments']])
+    for m in np.unique(sizes):
+        group = starts[sizes == m]
+        n_seg = 2 * m * nf
+        if scenario == 'singlehouse':
+            pathloss = cache.get('singlehouse', sw, bw, 2 * m, 1, 0)['pathloss'].data
+        else:
+            pathloss = cache.get('apartment', sw, bw, 2 * m, nf, fh)['pathloss'].data
+            src, dst = condensed_to_pairs(n_seg, np.arange(len(pathloss)))
+            shadowed = (src // nf) != (dst // nf)
+        # a block of segments at a time, keeping (segments x pairs) below max_pairs
+        per_block = max(1, max_pairs // max(len(pathloss), 1))
+        for g0 in range(0, len(group), per_block):
+            offsets = group[g0:g0 + per_block]
+            pl = np.broadcast_to(pathloss, (len(offsets), len(pathloss)))
+            if scenario == 'singlehouse':
+                capacity = ws.calculate_link_capacity(txp, pl)
+            else:
+                ldb = wa.pair_shadowing(key, n_nodes, offsets[:, None] + src, offsets[:, None] + dst)
+                ldb[:, ~shadowed] = 0
+                capacity = wa.calculate_link_capacity(txp, pl + ldb)
+            seg, k = np.nonzero(capacity > thr)
+            i, j = condensed_to_pairs(n_seg, k)
+            srcs.append(offsets[seg] + i)
+            dsts.append(offsets[seg] + j)
+            caps.append(capacity[seg, k])
+    return np.concatenate(srcs), np.concatenate(dsts), np.concatenate(caps)
+
+def cross_street_links(scenario, layout, bw, txp, thr, key, shadow_bound=rp.SHADOW_BOUND):
+
+    """
+    Links between nodes of different segments. Only the pairs within the maximum link
+    distance are evaluated, the buildings on their line of sight come from
+    count_building_crossings and the shadowing is clipped to shadow_bound like the
+    pruned single-street mode. Inside a segment the single-street model is kept (no
+    building between the two sides of the street), so a grid of one street reproduces it.
+
+    :return: (src, dst, capacity) of the links above thr, in global node ids
+    """
+    if scenario == 'singlehouse':
+        shadow_bound = -ws.SINGLEHOUSE_SHADOWING
+    crds = layout['crds']
+    src, dst = rp.find_candidate_pairs(crds, rp.calculate_max_link_distance(txp, thr, shadow_bound))
+    keep = layout['segment'][src] != layout['segment'][dst]
+    src, dst = src[keep], dst[keep]
+    diff = crds[src] - crds[dst]
+    dist = np.round(np.sqrt(np.einsum('ij,ij->i', diff, diff)), 2)
+    # every floor of a building shares its line of sight, so each building pair is tested once
+    fp = layout['footprints']
+    centers = np.column_stack(((fp[:, 0] + fp[:, 2]) / 2, (fp[:, 1] + fp[:, 3]) / 2))
+    b_pairs, inverse = np.unique(layout['building'][src] * len(fp) + layout['building'][dst], return_inverse=True)
+    b_src, b_dst = b_pairs // len(fp), b_pairs % len(fp)
+    ints = count_building_crossings(centers[b_src], centers[b_dst], fp, b_src, b_dst)[inverse.ravel()]
+    if scenario == 'singlehouse':
+        pathloss = ws.calculate_pathloss_for_residential_area(dist, ints)
+    else:
+        ldb = np.clip(wa.pair_shadowing(key, len(crds), src, dst), -shadow_bound, shadow_bound)
+        pathloss = wa.calculate_pathloss_for_residential_area(dist, ints, ldb=ldb)
+    capacity = wa.calculate_link_capacity(txp, pathloss)
+    links = capacity > thr
+    return src[links], dst[links], capacity[links]
+
+def city_grid_graph_info(scenario, n_streets, n_avenues, block, sw, bw, nf, fh, txp, thr, weighted=False, seed=None,
+                         cache=None):
+
+    """
+    :param scenario: 'apartment' or 'singlehouse' (nf and fh are ignored for single houses)
+    :param n_streets: number of horizontal streets
+    :param n_avenues: number of vertical streets
+    :param block: side of a city block between two streets (in meter)
+    :param weighted: if True, the adjacency matrix holds the link capacities as edge weights
+    :param seed: seed of the shadowing draws
+    :param cache: GeometryCache of the segment geometries, the module-level default_cache if None
+    :return: (CSR adjacency matrix of the whole grid, layout of get_grid_layout)
+    """
+    if scenario == 'singlehouse':
+        nf, fh = 1, 0
+    key = shadowing.get_shadowing_key(seed)
+    if cache is None:
+        cache = gcache.default_cache
+    layout = get_grid_layout(n_streets, n_avenues, block, sw, bw, nf, fh)
+    inner = segment_links(scenario, layout, sw, bw, nf, fh, txp, thr, key, cache)
+    cross = cross_street_links(scenario, layout, bw, txp, thr, key)
+    src, dst, capacity = (np.concatenate(pair) for pair in zip(inner, cross))
+    adj = graph_ops.pairs_to_adjacency(len(layout['crds']), src, dst, capacity if weighted else None)
+    return adj, layout
+
+
+if __name__ == "__main__":
+
+    adj, layout = city_grid_graph_info('apartment', n_streets=4, n_avenues=4, block=80, sw=20, bw=7, nf=4, fh=3.5,
+                                       txp=20, thr=0.0005, seed=1)
+    info = graph_ops.analyze_adjacency(adj)
+    print("{} nodes in {} segments, average degree {:.2f}, {} component(s)".format(
+        adj.shape[0], len(layout['segments']), info['average_degree'], info['n_components']))
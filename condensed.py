@@ -0,0 +1,193 @@
+import numpy as np
+
+def condensed_size(n):
+
+    """
+    :param n: number of nodes
+    :return: number of unordered pairs i < j, the length of a condensed vector
+    """
+    return n * (n - 1) // 2
+
+def condensed_index(n, i, j):
+
+    """
+    :param n: number of nodes
+    :param i: node id(s) of the first end, i != j
+    :param j: node id(s) of the second end
+    :return: position of the pair (i, j) in the condensed vector, in the order used by scipy pdist
+    """
+    i = np.asarray(i)
+    j = np.asarray(j)
+    lo = np.minimum(i, j)
+    hi = np.maximum(i, j)
+    return n * lo - (lo * (lo + 1)) // 2 + (hi - lo - 1)
+
+def get_row_starts(n):
+
+    """
+    :param n: number of nodes
+    :return: condensed position of the first pair (i, i + 1) of every row i, followed by the total size
+    """
+    row_len = n - 1 - np.arange(n, dtype=np.int64)
+    return np.concatenate(([0], np.cumsum(row_len)))
+
+def condensed_to_pairs(n, k):
+
+    """
+    :param n: number of nodes
+    :param k: positions in the condensed vector
+    :return: node ids (i, j), i < j, of the pairs at those positions
+    """
+    row_start = get_row_starts(n)
+    k = np.asarray(k, dtype=np.int64)
+    i = np.searchsorted(row_start, k, side='right') - 1
+    j = k - row_start[i] + i + 1
+    return i, j
+
+def get_row_blocks(n, max_pairs=2**20):
+
+    """
+    :param n: number of nodes
+    :param max_pairs: upper bound on the number of pairs in one block (at least one full row)
+    :return: list of (r0, r1), consecutive row ranges whose pairs fill the condensed slice
+             [row_start[r0], row_start[r1]). The split only depends on n and max_pairs
+    """
+    row_start = get_row_starts(n)
+    blocks = []
+    r0 = 0
+    while r0 < n - 1:
+        r1 = int(np.searchsorted(row_start, row_start[r0] + max_pairs, side='right')) - 1
+        r1 = min(max(r1, r0 + 1), n - 1)
+        blocks.append((r0, r1))
+        r0 = r1
+    return blocks
+
+def get_block_pairs(n, r0, r1, row_start=None):
+
+    """
+    :param n: number of nodes
+    :param r0: first row of the block
+    :param r1: end row of the block (excluded)
+    :param row_start: get_row_starts(n), computed here if None
+    :return: (k0, k1, src, dst), the condensed slice [k0, k1) of the rows and the node ids of its pairs
+    """
+    if row_start is None:
+        row_start = get_row_starts(n)
+    id_type = np.int32 if n < np.iinfo(np.int32).max else np.int64
+    k0, k1 = int(row_start[r0]), int(row_start[r1])
+    # local offsets stay small, so the ids can be built in a narrow integer type
+    local_type = np.int32 if k1 - k0 < np.iinfo(np.int32).max else np.int64
+    counts = np.diff(row_start[r0:r1 + 1])
+    src = np.repeat(np.arange(r0, r1, dtype=id_type), counts)
+    dst = np.arange(k1 - k0, dtype=local_type) - np.repeat((row_start[r0:r1] - k0).astype(local_type), counts)
+    dst = dst.astype(id_type, copy=False) + src + 1
+    return k0, k1, src, dst
+
+def iter_pair_blocks(n, max_pairs=2**20):
+
+    """
+    :param n: number of nodes
+    :param max_pairs: upper bound on the number of pairs in one block (at least one full row)
+    :return: generator of (k0, k1, src, dst), the condensed slice [k0, k1) and the node ids of its pairs
+    """
+    row_start = get_row_starts(n)
+    for r0, r1 in get_row_blocks(n, max_pairs):
+        yield get_block_pairs(n, r0, r1, row_start)
+
+class CondensedMatrix(object):
+
+    """
+    Symmetric n x n matrix stored as its upper triangle, one value per unordered pair
+    (i < j) in scipy pdist order, plus a constant diagonal. Pairwise values in this
+    project (distance, intersection, pathloss, link capacity) are all symmetric, so
+    this halves their memory and needs no mirror pass.
+
+    m[i, j] returns one value (arrays of i and j are accepted), m[i] returns row i
+    as an array, so the m[i][j] indexing of the list-of-lists code keeps working.
+    """
+
+    def __init__(self, data, n, diagonal=0):
+
+        data = np.asarray(data)
+        if data.ndim != 1 or len(data) != condensed_size(n):
+            raise ValueError("condensed data of {} nodes must have {} values, got {}".format(n, condensed_size(n), data.shape))
+        self.data = data
+        self.n = n
+        self.diagonal = diagonal
+
+    @classmethod
+    def from_square(cls, mat):
+
+        """
+        :param mat: symmetric (n x n) matrix
+        :return: CondensedMatrix of its upper triangle, with the diagonal of mat[0, 0]
+        """
+        mat = np.asarray(mat)
+        n = mat.shape[0]
+        return cls(mat[np.triu_indices(n, 1)], n, diagonal=mat[0, 0] if n > 0 else 0)
+
+    @property
+    def shape(self):
+
+        return (self.n, self.n)
+
+    @property
+    def dtype(self):
+
+        return self.data.dtype
+
+    def __len__(self):
+
+        return self.n
+
+    def __getitem__(self, key):
+
+        if isinstance(key, tuple):
+            i, j = key
+            i = np.asarray(i)
+            j = np.asarray(j)
+            same = i == j
+            k = condensed_index(self.n, np.where(same, 0, i), np.where(same, 1, j))
+            values = np.where(same, self.diagonal, self.data[k] if self.n > 1 else self.diagonal)
+            return values[()] if values.ndim == 0 else values
+        return self.row(key)
+
+    def __iter__(self):
+
+        for i in range(self.n):
+            yield self.row(i)
+
+    def row(self, i):
+
+        """
+        :param i: node id
+        :return: row i of the full matrix as an array of length n
+        """
+        cols = np.arange(self.n)
+        out = np.full(self.n, self.diagonal, dtype=self.data.dtype)
+        others = cols != i
+        out[others] = self.data[condensed_index(self.n, i, cols[others])]
+        return out
+
+    def to_square(self):
+
+        """
+        :return: the full (n x n) matrix
+        """
+        out = np.empty((self.n, self.n), dtype=self.data.dtype)
+        iu = np.triu_indices(self.n, 1)
+        out[iu] = self.data
+        out.T[iu] = self.data
+        np.fill_diagonal(out, self.diagonal)
+        return out
+
+    def map(self, func, diagonal=None):
+
+        """
+        :param func: elementwise function applied to the pair values
+        :param diagonal: diagonal of the result, func(diagonal) if None
+        :return: new CondensedMatrix holding func of every pair value
+        """
+        if diagonal is None:
+            diagonal = func(self.diagonal)
+        return CondensedMatrix(func(self.data), self.n, diagonal=diagonal)
@@ -1,6 +1,9 @@
-from scipy.spatial import distance
+import numpy as np
 import sys
+import instrumentation
+from condensed import CondensedMatrix, condensed_size, iter_pair_blocks
 
+@instrumentation.instrument('coordinates', count=lambda allc: len(allc[0]))
 def get_all_coordinates(sw, bw, bn, nf, fh):
 
     """
@@ -44,32 +47,119 @@ def get_all_coordinates(sw, bw, bn, nf, fh):
         all_coordinates.append(zcords)
         return all_coordinates
 
-def get_distance_matrix(all_coords):
+def get_coordinate_array(all_coords, dtype=np.float64):
+
+    """
+    :param all_coords: 3D coordinates of the nodes, as returned by get_all_coordinates
+    :param dtype: floating point type of the returned array
+    :return: an (n, 3) contiguous array, one row of (x, y, z) per node
+    """
+    return np.ascontiguousarray(np.asarray(all_coords, dtype=dtype).T)
+
+@instrumentation.instrument('distance', count=np.size)
+def get_distance_matrix(all_coords, dtype=np.float64):
 
     """
     :param all_coords: 3D coordinates of the nodes
-    :return: distance between any two node
+    :param dtype: floating point type of the returned matrix (float64 or float32)
+    :return: distance between any two node, as an (n, n) array rounded to 2 decimals
     """
-    xcoords = all_coords[0]
-    ycoords = all_coords[1]
-    zcoords = all_coords[2]
-    bn = len(xcoords)
-    distance_mat = [[0 for col in range(bn)] for row in range(bn)]
-    count = 0
-    while count < (bn-1):
-        j = count + 1
-        while j < bn:
-            a = (xcoords[count], ycoords[count], zcoords[count])
-            b = (xcoords[j], ycoords[j], zcoords[j])
-            distance_mat[count][j] = round(distance.euclidean(a, b), 2)
-            j += 1
-        count += 1
-    for i in range(0, bn):
-        for j in range(0, bn):
-            if (i != j):
-                distance_mat[j][i] = distance_mat[i][j]
+    crds = get_coordinate_array(all_coords, dtype=dtype)
+    n = crds.shape[0]
+    distance_mat = np.zeros((n, n), dtype=dtype)
+    diff = np.empty((n, n), dtype=dtype)
+    # accumulate the squared differences axis by axis, so that only two n x n
+    # buffers are alive at any time
+    for axis in range(crds.shape[1]):
+        col = crds[:, axis]
+        np.subtract(col[:, None], col[None, :], out=diff)
+        np.multiply(diff, diff, out=diff)
+        distance_mat += diff
+    np.sqrt(distance_mat, out=distance_mat)
+    np.round(distance_mat, 2, out=distance_mat)
     return distance_mat
 
+@instrumentation.instrument('distance', count=lambda mat: len(mat.data))
+def get_condensed_distance_matrix(all_coords, dtype=np.float64):
+
+    """
+    :param all_coords: 3D coordinates of the nodes
+    :param dtype: floating point type of the stored distances (float64 or float32)
+    :return: CondensedMatrix of the distance between any two nodes, rounded to 2 decimals
+    """
+    from scipy.spatial.distance import pdist
+    crds = get_coordinate_array(all_coords)
+    dist = pdist(crds)
+    np.round(dist, 2, out=dist)
+    return CondensedMatrix(dist.astype(dtype, copy=False), crds.shape[0])
+
+@instrumentation.instrument('distance', count=np.size)
+def get_pair_distances(crds, src, dst):
+
+    """
+    :param crds: (n, 3) coordinate array, as returned by get_coordinate_array
+    :param src: node ids of the first end of each pair
+    :param dst: node ids of the second end of each pair
+    :return: distance of each pair of nodes, rounded to 2 decimals like get_distance_matrix
+    """
+    diff = crds[src] - crds[dst]
+    dist = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+    return np.round(dist, 2, out=dist)
+
+def get_intersection_counts(src, dst, bn, nf=1):
+
+    """
+    :param src: node ids of the first end of each pair (any shape, broadcast against dst)
+    :param dst: node ids of the second end of each pair
+    :param bn: total number of buildings (counting both sides of the road)
+    :param nf: number of floors in each building
+    :return: int16 array with the number of buildings that lie between the two nodes of each pair
+
+    Two nodes on opposite sides of the road see each other across the street, so no
+    building lies between them. On the same side the count is the number of buildings
+    strictly between their two buildings, i.e. max(|b_i - b_j| - 1, 0).
+    """
+    total_nodes = bn * nf
+    node_eachside = int(total_nodes / 2)
+    dtype = np.int16 if bn <= np.iinfo(np.int16).max else np.int32
+    src = np.asarray(src)
+    dst = np.asarray(dst)
+    # nodes on the far side are counted from the other end of the street,
+    # which is how the building ids are mirrored across the road
+    src_ids = np.where(src < node_eachside, src, total_nodes - 1 - src) // nf
+    dst_ids = np.where(dst < node_eachside, dst, total_nodes - 1 - dst) // nf
+    counts = np.abs(src_ids - dst_ids).astype(dtype)
+    counts -= 1
+    np.maximum(counts, 0, out=counts)
+    counts[(src >= node_eachside) != (dst >= node_eachside)] = 0
+    return counts
+
+@instrumentation.instrument('intersection', count=np.size)
+def get_intersection_matrix(bn, nf=1):
+
+    """
+    :param bn: total number of buildings (counting both sides of the road)
+    :param nf: number of floors in each building
+    :return: an (n, n) int16 array with the number of buildings that lie between any two nodes
+    """
+    node_ids = np.arange(bn * nf)
+    return get_intersection_counts(node_ids[:, None], node_ids[None, :], bn, nf)
+
+@instrumentation.instrument('intersection', count=lambda mat: len(mat.data))
+def get_condensed_intersection_matrix(bn, nf=1):
+
+    """
+    :param bn: total number of buildings (counting both sides of the road)
+    :param nf: number of floors in each building
+    :return: CondensedMatrix of the number of buildings that lie between any two nodes
+    """
+    total_nodes = bn * nf
+    dtype = np.int16 if bn <= np.iinfo(np.int16).max else np.int32
+    int_vec = np.empty(condensed_size(total_nodes), dtype=dtype)
+    for k0, k1, src, dst in iter_pair_blocks(total_nodes):
+        int_vec[k0:k1] = get_intersection_counts(src, dst, bn, nf)
+    return CondensedMatrix(int_vec, total_nodes)
+
 if __name__ == "__main__":
 
     sw = 1
@@ -0,0 +1,176 @@
+import os
+import tempfile
+from collections import OrderedDict
+import numpy as np
+import coordinates
+import graph_ops
+import instrumentation
+import wireless_apartments as wa
+import wireless_singlehouse as ws
+from condensed import CondensedMatrix
+
+class GeometryCache(object):
+
+    """
+    Memoizes the condensed pairwise arrays that only depend on the street and
+    building geometry (sw, bw, bn, nf, fh): distance, intersection and the
+    pathloss without the shadowing term. TxPower and the bitrate/speed threshold only
+    enter the capacity transform applied on top of these arrays.
+
+    Entries are evicted in least-recently-used order once more than maxsize
+    geometries are held. If cache_dir is given, every entry is also stored
+    there as .npy files and reloaded (memory-mapped) by later processes. Each
+    file is written under a temporary name and renamed into place, so a
+    concurrent process never maps a half-written array.
+    """
+
+    def __init__(self, maxsize=8, cache_dir=None):
+
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _file_name(self, key, name):
+
+        return os.path.join(self.cache_dir, "{}_sw{}_bw{}_bn{}_nf{}_fh{}_{}.npy".format(key[0], *key[1:], name))
+
+    def _load(self, key):
+
+        entry = {}
+        total_nodes = key[3] * key[4]
+        for name in ('dist', 'ints', 'pathloss'):
+            path = self._file_name(key, name)
+            if not os.path.exists(path):
+                return None
+            entry[name] = CondensedMatrix(np.load(path, mmap_mode='r'), total_nodes)
+        return entry
+
+    def _store(self, key, entry):
+
+        for name in entry:
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-', suffix='.npy')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, entry[name].data)
+                os.replace(tmp, self._file_name(key, name))
+            except BaseException:
+                os.remove(tmp)
+                raise
+
+    def get(self, scenario, sw, bw, bn, nf, fh):
+
+        """
+        :param scenario: 'apartment' or 'singlehouse'
+        :param sw: width of the street (in meter)
+        :param bw: width of a single building (in meter)
+        :param bn: number of buildings (including both sides of the road)
+        :param nf: number of floors in each building
+        :param fh: height of each floor
+        :return: dictionary with the 'dist', 'ints' and 'pathloss' CondensedMatrix of this geometry
+        """
+        key = (scenario, float(sw), float(bw), int(bn), int(nf), float(fh))
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        entry = self._load(key) if self.cache_dir is not None else None
+        if entry is None:
+            entry = compute_geometry_entry(*key)
+            if self.cache_dir is not None:
+                self._store(key, entry)
+        self.entries[key] = entry
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+
+        self.entries.clear()
+
+
+def compute_geometry_entry(scenario, sw, bw, bn, nf, fh):
+
+    """
+    :param scenario: 'apartment' or 'singlehouse'
+    :return: dictionary with the distance, intersection and shadowing-free pathloss CondensedMatrix
+    """
+    allc = coordinates.get_all_coordinates(sw, bw, bn, nf, fh)
+    entry = {}
+    entry['dist'] = coordinates.get_condensed_distance_matrix(allc)
+    entry['ints'] = coordinates.get_condensed_intersection_matrix(bn, nf)
+    if scenario == 'singlehouse':
+        # the single-house model has a fixed shadowing term, so its pathloss is fully deterministic
+        with instrumentation.stage('pathloss', count=len(entry['dist'].data)):
+            entry['pathloss'] = CondensedMatrix(ws.calculate_pathloss_for_residential_area(entry['dist'].data, entry['ints'].data), bn)
+    else:
+        entry['pathloss'] = wa.calculate_condensed_mean_pathloss(entry['dist'], entry['ints'], nf)
+    return entry
+
+default_cache = GeometryCache()
+
+def cached_pathloss(scenario, sw, bw, bn, nf, fh, seed=None, cache=None):
+
+    """
+    :param scenario: 'apartment' or 'singlehouse' (nf and fh are ignored for single houses)
+    :param seed: seed of the apartment shadowing draw
+    :param cache: GeometryCache to use, the module-level default_cache if None
+    :return: CondensedMatrix of the pathloss in dB, the cached mean pathloss plus a fresh
+             shadowing draw for apartments
+    """
+    if cache is None:
+        cache = default_cache
+    if scenario == 'singlehouse':
+        return cache.get('singlehouse', sw, bw, bn, 1, 0)['pathloss']
+    entry = cache.get('apartment', sw, bw, bn, nf, fh)
+    return CondensedMatrix(entry['pathloss'].data + wa.draw_condensed_shadowing(bn * nf, seed, nf).data, bn * nf)
+
+def cached_link_capacity(scenario, sw, bw, bn, nf, fh, txp, seed=None, cache=None):
+
+    """
+    :param scenario: 'apartment' or 'singlehouse' (nf and fh are ignored for single houses)
+    :param seed: seed of the apartment shadowing draw
+    :param cache: GeometryCache to use, the module-level default_cache if None
+    :return: CondensedMatrix of the link capacity, only the shadowing draw and the capacity
+             transform are computed again
+    """
+    pathloss = cached_pathloss(scenario, sw, bw, bn, nf, fh, seed=seed, cache=cache)
+    if scenario == 'singlehouse':
+        with instrumentation.stage('capacity', count=len(pathloss.data)):
+            return CondensedMatrix(ws.calculate_link_capacity(txp, pathloss.data), bn)
+    return wa.calculate_link_capacity_matrix(pathloss, tx_power=txp)
+
+def cached_apartments_graph_info(sw, bw, bn, nf, fh, txp, thr, as_sparse=False, weighted=False, seed=None, cache=None):
+
+    """
+    Same result as wireless_apartments.wireless_apartments_graph_info, but the geometry
+    dependent arrays are taken from the cache, so only the shadowing draw, the capacity
+    transform and the threshold are computed again.
+
+    :param cache: GeometryCache to use, the module-level default_cache if None
+    :return: list of edges, or a CSR adjacency matrix if as_sparse is True
+    """
+    l_mat = cached_link_capacity('apartment', sw, bw, bn, nf, fh, txp, seed=seed, cache=cache)
+    adj = graph_ops.condensed_to_adjacency(l_mat, thr, weighted=weighted)
+    if as_sparse:
+        return adj
+    return graph_ops.adjacency_to_edge_list(adj)
+
+def cached_singlehouse_graph_info(sw, bw, bn, txp, thr, as_sparse=False, weighted=False, cache=None):
+
+    """
+    Same result as wireless_singlehouse.wireless_singlehouse_graph_info, with the geometry
+    dependent arrays taken from the cache.
+
+    :param cache: GeometryCache to use, the module-level default_cache if None
+    :return: list of edges, or a CSR adjacency matrix if as_sparse is True
+    """
+    l_mat = cached_link_capacity('singlehouse', sw, bw, bn, 1, 0, txp, cache=cache)
+    adj = graph_ops.condensed_to_adjacency(l_mat, thr, weighted=weighted)
+    if as_sparse:
+        return adj
+    return graph_ops.adjacency_to_edge_list(adj, lower_only=True)
@@ -0,0 +1,120 @@
+import json
+import os
+import struct
+import sys
+import zipfile
+import numpy as np
+from scipy import sparse
+import graph_ops
+import instrumentation
+
+def write_npz(path, adj, metadata):
+
+    """
+    :param path: output .npz file
+    :param adj: scipy.sparse adjacency matrix, its values (e.g. link capacities) are kept
+    :param metadata: dictionary of scenario parameters, stored as JSON next to the arrays
+    :return: writes the CSR arrays uncompressed, so that load_graph can memory-map them
+    """
+    adj = sparse.csr_matrix(adj)
+    np.savez(path, indptr=adj.indptr, indices=adj.indices, data=adj.data, shape=np.array(adj.shape),
+             metadata=np.array(json.dumps(metadata, sort_keys=True)))
+
+def write_yaml(path, adj, metadata):
+
+    """
+    :param path: output .yaml file
+    :param adj: scipy.sparse adjacency matrix
+    :param metadata: dictionary of scenario parameters, stored as graph attributes
+    :return: writes the graph in networkx node-link form as YAML (needs networkx and PyYAML)
+    """
+    import networkx as nx
+    import yaml
+    G = graph_ops.adjacency_to_networkx(adj)
+    G.graph.update(metadata)
+    data = nx.node_link_data(G)
+    with open(path, 'w') as f:
+        yaml.safe_dump(json.loads(json.dumps(data, default=float)), f)
+
+def write_graphml(path, adj, metadata):
+
+    """
+    :param path: output .graphml file
+    :param adj: scipy.sparse adjacency matrix
+    :param metadata: dictionary of scenario parameters, stored as graph attributes
+    :return: writes the graph as GraphML (needs networkx)
+    """
+    import networkx as nx
+    G = graph_ops.adjacency_to_networkx(adj)
+    G.graph.update(metadata)
+    nx.write_graphml(G, path)
+
+GRAPH_WRITERS = {'npz': write_npz, 'yaml': write_yaml, 'graphml': write_graphml}
+
+@instrumentation.instrument('graph_export')
+def save_graph(path, adj, metadata=None, fmt='npz'):
+
+    """
+    :param path: output file
+    :param adj: scipy.sparse adjacency matrix
+    :param metadata: dictionary of scenario parameters
+    :param fmt: one of the keys of GRAPH_WRITERS, the compact binary 'npz' by default
+    :return: path the graph was written to with the selected writer. A suffix naming another
+             format (e.g. graph.npz with fmt='yaml') is replaced by the suffix of fmt
+    """
+    if fmt not in GRAPH_WRITERS:
+        sys.exit("Unknown graph format '{}', expected one of {}".format(fmt, sorted(GRAPH_WRITERS)))
+    root, ext = os.path.splitext(path)
+    if ext[1:].lower() in GRAPH_WRITERS:
+        path = root + '.' + fmt
+    GRAPH_WRITERS[fmt](path, adj, metadata if metadata is not None else {})
+    return path
+
+def _mmap_npz_member(path, zinfo):
+
+    """
+    :param path: .npz file written without compression
+    :param zinfo: zipfile.ZipInfo of one .npy member
+    :return: read-only numpy.memmap over the member data
+    """
+    with open(path, 'rb') as f:
+        # local file header: 30 fixed bytes, then the file name and extra field
+        f.seek(zinfo.header_offset)
+        header = f.read(30)
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        f.seek(zinfo.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if shape == () or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape, order='F' if fortran_order else 'C')
+
+def load_graph(path, mmap=False):
+
+    """
+    :param path: .npz file written by write_npz
+    :param mmap: if True, the CSR arrays are memory-mapped from the file instead of read into memory
+    :return: (scipy.sparse CSR adjacency matrix, metadata dictionary)
+    """
+    with np.load(path) as npz:
+        metadata = json.loads(str(npz['metadata']))
+        shape = tuple(npz['shape'])
+        if not mmap:
+            return sparse.csr_matrix((npz['data'], npz['indices'], npz['indptr']), shape=shape), metadata
+    arrays = {}
+    with zipfile.ZipFile(path) as zf:
+        for name in ('indptr', 'indices', 'data'):
+            zinfo = zf.getinfo(name + '.npy')
+            if zinfo.compress_type != zipfile.ZIP_STORED:
+                sys.exit("{} is compressed and cannot be memory-mapped".format(path))
+            arrays[name] = _mmap_npz_member(path, zinfo)
+    adj = sparse.csr_matrix(shape, dtype=arrays['data'].dtype)
+    # assign the memmaps directly, the constructor would copy them
+    adj.indptr = arrays['indptr']
+    adj.indices = arrays['indices']
+    adj.data = arrays['data']
+    return adj, metadata
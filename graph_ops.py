@@ -0,0 +1,211 @@
+import sys
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+import instrumentation
+from bit_adjacency import BitAdjacency, condensed_to_bit_adjacency
+from condensed import condensed_to_pairs
+
+STORAGES = ('auto', 'sparse', 'bitpacked')
+
+@instrumentation.instrument('edges', count=lambda adj: adj.nnz)
+def create_adjacency_matrix(lnk_mat, threshold, weighted=False):
+
+    """
+    :param lnk_mat: link capacity matrix (n x n)
+    :param threshold: it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :param weighted: if True, the stored values are the link capacities, otherwise 1 for every edge
+    :return: scipy.sparse CSR adjacency matrix of the links whose capacity exceeds the threshold
+    """
+    lnk_mat = np.asarray(lnk_mat)
+    edge_mask = lnk_mat > threshold
+    np.fill_diagonal(edge_mask, False)
+    if not weighted:
+        return sparse.csr_matrix(edge_mask, dtype=np.int8)
+    adj = sparse.csr_matrix(edge_mask, dtype=lnk_mat.dtype)
+    # csr_matrix stores a dense input in row-major order, the same order
+    # boolean indexing uses, so the capacities can be dropped in directly
+    adj.data = lnk_mat[edge_mask]
+    return adj
+
+def condensed_to_adjacency(cmat, threshold, weighted=False):
+
+    """
+    :param cmat: CondensedMatrix of the link capacities
+    :param threshold: it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :param weighted: if True, the stored values are the link capacities, otherwise 1 for every edge
+    :return: symmetric scipy.sparse CSR adjacency matrix of the links whose capacity exceeds the threshold
+    """
+    links = np.flatnonzero(cmat.data > threshold)
+    src, dst = condensed_to_pairs(cmat.n, links)
+    weights = cmat.data[links] if weighted else None
+    return pairs_to_adjacency(cmat.n, src.astype(np.int32), dst.astype(np.int32), weights)
+
+def adjacency_nbytes(n, n_edges, storage, value_itemsize=1):
+
+    """
+    :param n: number of nodes
+    :param n_edges: number of undirected edges
+    :param storage: 'sparse' or 'bitpacked'
+    :param value_itemsize: bytes of one stored value of the sparse matrix
+    :return: bytes taken by the adjacency matrix: CSR stores a value and an int32 index for
+             each edge in both directions plus the row pointers, the bit rows n*ceil(n/8) bytes
+    """
+    if storage == 'bitpacked':
+        return n * ((n + 7) // 8)
+    return 2 * n_edges * (value_itemsize + 4) + 4 * (n + 1)
+
+def choose_storage(n, n_edges, value_itemsize=1):
+
+    """
+    :return: 'bitpacked' if the bit rows take less memory than the CSR matrix, otherwise 'sparse'
+             (for int8 values the switch is at 1/40 of the pairs linked)
+    """
+    if adjacency_nbytes(n, n_edges, 'bitpacked') < adjacency_nbytes(n, n_edges, 'sparse', value_itemsize):
+        return 'bitpacked'
+    return 'sparse'
+
+def condensed_to_graph(cmat, threshold, weighted=False, storage='auto'):
+
+    """
+    :param cmat: CondensedMatrix of the link capacities
+    :param threshold: it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :param weighted: if True, the sparse matrix stores the link capacities, otherwise 1 for every edge
+    :param storage: 'sparse', 'bitpacked', or 'auto' to pick the smaller of the two for the
+                    number of edges above the threshold
+    :return: scipy.sparse CSR adjacency matrix or BitAdjacency of the links whose capacity exceeds
+             the threshold. A BitAdjacency holds no weights, the capacities stay in cmat
+    """
+    if storage not in STORAGES:
+        sys.exit("Unknown graph storage '{}', expected one of {}".format(storage, STORAGES))
+    if storage == 'auto':
+        n_edges = int(np.count_nonzero(cmat.data > threshold))
+        storage = choose_storage(cmat.n, n_edges, cmat.data.dtype.itemsize if weighted else 1)
+    if storage == 'bitpacked':
+        return condensed_to_bit_adjacency(cmat, threshold)
+    return condensed_to_adjacency(cmat, threshold, weighted=weighted)
+
+def adjacency_to_edge_list(adj, lower_only=False):
+
+    """
+    :param adj: scipy.sparse adjacency matrix
+    :param lower_only: if True, only the (i, j) tuples with i > j are returned
+    :return: list of edge tuples (i, j), in row-major order
+    """
+    coo = adj.tocoo()
+    rows, cols = coo.row, coo.col
+    if lower_only:
+        keep = rows > cols
+        rows, cols = rows[keep], cols[keep]
+    order = np.lexsort((cols, rows))
+    return list(zip(rows[order].tolist(), cols[order].tolist()))
+
+@instrumentation.instrument('edges', count=lambda adj: adj.nnz)
+def pairs_to_adjacency(n, src, dst, weights=None):
+
+    """
+    :param n: number of nodes
+    :param src: node ids of the first end of each undirected edge
+    :param dst: node ids of the second end of each undirected edge
+    :param weights: optional edge weights (e.g. link capacities), 1 for every edge if None
+    :return: symmetric scipy.sparse CSR adjacency matrix holding both (i, j) and (j, i)
+    """
+    if weights is None:
+        weights = np.ones(len(src), dtype=np.int8)
+    rows = np.concatenate((src, dst))
+    cols = np.concatenate((dst, src))
+    data = np.concatenate((weights, weights))
+    return sparse.csr_matrix((data, (rows, cols)), shape=(n, n))
+
+def edge_list_to_adjacency(n, edge_list):
+
+    """
+    :param n: number of nodes
+    :param edge_list: list of (i, j) tuples, one or both orientations of each edge
+    :return: symmetric scipy.sparse CSR adjacency matrix with a 1 for every edge
+    """
+    if len(edge_list) == 0:
+        return sparse.csr_matrix((n, n), dtype=np.int8)
+    edges = np.asarray(edge_list)
+    adj = sparse.csr_matrix((np.ones(len(edges), dtype=np.int8), (edges[:, 0], edges[:, 1])), shape=(n, n))
+    adj = adj + adj.T
+    adj.data[:] = 1
+    return adj
+
+@instrumentation.instrument('graph_analysis', count=lambda info: len(info['degrees']))
+def analyze_adjacency(adj):
+
+    """
+    :param adj: symmetric scipy.sparse adjacency matrix or BitAdjacency
+    :return: dictionary with
+        degrees - degree of every node (row sums)
+        average_degree - mean node degree
+        n_components - number of connected components
+        is_connected - True if the graph has a single component
+        giant_component_size - number of nodes in the largest component
+        degree_histogram - number of nodes with degree 0, 1, 2, ...
+    """
+    n = adj.shape[0]
+    if isinstance(adj, BitAdjacency):
+        degrees = adj.degrees()
+        n_components, labels = adj.connected_components()
+    else:
+        adj = sparse.csr_matrix(adj)
+        degrees = np.diff(adj.indptr) - (adj.diagonal() != 0)
+        n_components, labels = csgraph.connected_components(adj, directed=False)
+    info = {}
+    info['degrees'] = degrees
+    info['average_degree'] = float(degrees.sum()) / n if n > 0 else 0.0
+    info['n_components'] = n_components
+    info['is_connected'] = n_components == 1
+    info['giant_component_size'] = int(np.bincount(labels).max()) if n > 0 else 0
+    info['degree_histogram'] = np.bincount(degrees)
+    return info
+
+class UnionFind(object):
+
+    """
+    Disjoint sets of the nodes 0..n-1 with union by size and path halving, so that
+    edges can be added one at a time while the components are tracked.
+    """
+
+    def __init__(self, n):
+
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.n_components = n
+        self.giant_component_size = 1 if n > 0 else 0
+
+    def find(self, a):
+
+        parent = self.parent
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    def union(self, a, b):
+
+        """
+        :return: True if a and b were in different components, which are now merged
+        """
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return False
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        self.n_components -= 1
+        if self.size[ra] > self.giant_component_size:
+            self.giant_component_size = self.size[ra]
+        return True
+
+def adjacency_to_networkx(adj):
+
+    """
+    :param adj: scipy.sparse adjacency matrix, weights are kept as the 'weight' edge attribute
+    :return: networkx Graph of the adjacency matrix (networkx is only imported here)
+    """
+    import networkx as nx
+    return nx.from_scipy_sparse_array(sparse.csr_array(adj))
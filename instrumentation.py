@@ -0,0 +1,178 @@
+import cProfile
+import functools
+import time
+import tracemalloc
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+class StageRecorder(object):
+
+    """
+    Collects wall time, CPU time, peak traced memory, RSS and element counts of
+    the pipeline stages. Stages may be nested; the figures of a stage include the
+    stages it calls. While disabled, stage() and the instrument() decorator cost a
+    single attribute check.
+
+    The RSS comes from ru_maxrss, the peak of the whole process so far: rss_growth_kb
+    is how much a stage raised that peak (0 if it stayed below an earlier peak) and
+    process_peak_rss_kb the process peak at the end of the stage.
+    """
+
+    def __init__(self):
+
+        self.enabled = False
+        self.trace_memory = False
+        self.stats = {}
+        self.order = []
+        self._stack = []
+        self._active = []
+
+    def enable(self, trace_memory=True):
+
+        self.enabled = True
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+
+        self.enabled = False
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_memory = False
+
+    def reset(self):
+
+        self.stats = {}
+        self.order = []
+
+    def _enter(self):
+
+        frame = {'wall': time.perf_counter(), 'cpu': time.process_time(), 'rss': self._max_rss()}
+        if self.trace_memory:
+            cur, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['start_mem'] = cur
+            frame['peak'] = cur
+        self._stack.append(frame)
+
+    @staticmethod
+    def _max_rss():
+
+        # process-wide peak resident set size in kB (Linux), 0 where resource is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else 0
+
+    def _exit(self, name, count):
+
+        frame = self._stack.pop()
+        wall = time.perf_counter() - frame['wall']
+        cpu = time.process_time() - frame['cpu']
+        peak_mem = 0
+        if self.trace_memory:
+            cur, peak = tracemalloc.get_traced_memory()
+            frame_peak = max(frame['peak'], peak)
+            peak_mem = frame_peak - frame['start_mem']
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], frame_peak)
+            tracemalloc.reset_peak()
+        rss = self._max_rss()
+        if name not in self.stats:
+            self.stats[name] = {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_memory': 0, 'rss_growth_kb': 0,
+                                'process_peak_rss_kb': 0, 'elements': 0}
+            self.order.append(name)
+        st = self.stats[name]
+        st['calls'] += 1
+        st['wall'] += wall
+        st['cpu'] += cpu
+        st['peak_memory'] = max(st['peak_memory'], peak_mem)
+        st['rss_growth_kb'] = max(st['rss_growth_kb'], rss - frame['rss'])
+        st['process_peak_rss_kb'] = max(st['process_peak_rss_kb'], rss)
+        if count is not None:
+            st['elements'] += int(count)
+
+    @contextmanager
+    def stage(self, name, count=None):
+
+        """
+        :param name: name of the pipeline stage
+        :param count: number of elements handled by the stage, can also be set later through the yielded dict
+        """
+        if not self.enabled or name in self._active:
+            # a stage calling a helper recorded under the same name is counted once
+            yield {}
+            return
+        info = {'count': count}
+        self._active.append(name)
+        self._enter()
+        try:
+            yield info
+        finally:
+            self._exit(name, info['count'])
+            self._active.pop()
+
+    def report(self):
+
+        """
+        :return: text table of the recorded stages, in the order they first ran
+        """
+        lines = ["{:20s} {:>6s} {:>10s} {:>10s} {:>14s} {:>15s} {:>16s} {:>12s}".format(
+            'stage', 'calls', 'wall [s]', 'cpu [s]', 'peak mem [B]', 'rss growth [kB]', 'process rss [kB]', 'elements')]
+        for name in self.order:
+            st = self.stats[name]
+            lines.append("{:20s} {:6d} {:10.4f} {:10.4f} {:14d} {:15d} {:16d} {:12d}".format(
+                name, st['calls'], st['wall'], st['cpu'], st['peak_memory'], st['rss_growth_kb'],
+                st['process_peak_rss_kb'], st['elements']))
+        return "\n".join(lines)
+
+recorder = StageRecorder()
+
+def stage(name, count=None):
+
+    """
+    :param name: name of the pipeline stage
+    :param count: number of elements handled by the stage
+    :return: context manager recording the stage on the module-level recorder
+    """
+    return recorder.stage(name, count)
+
+def instrument(name, count=None):
+
+    """
+    :param name: name of the pipeline stage
+    :param count: optional function of the stage result returning its number of elements
+    :return: decorator recording every call of the function as the given stage
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not recorder.enabled:
+                return func(*args, **kwargs)
+            with recorder.stage(name) as info:
+                result = func(*args, **kwargs)
+                if count is not None and result is not None:
+                    info['count'] = count(result)
+                return result
+        return wrapper
+    return decorator
+
+@contextmanager
+def profile(path):
+
+    """
+    :param path: file the cProfile statistics are dumped to, nothing is profiled if None
+    """
+    if path is None:
+        yield None
+        return
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield prof
+    finally:
+        prof.disable()
+        prof.dump_stats(path)
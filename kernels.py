@@ -0,0 +1,281 @@
+import sys
+import numpy as np
+import coordinates
+import wireless_apartments as wa
+import wireless_singlehouse as ws
+import shadowing
+from shadowing import philox4x64, UNIT_53
+from condensed import condensed_index
+from wireless_apartments import (RESIDENTIAL_ALPHA, RESIDENTIAL_BETA, RESIDENTIAL_GAMMA, FREQUENCY_GHZ, BUILDING_ENTRY_LOSS,
+                                 INDOOR_FREQUENCY_MHZ, INDOOR_DISTANCE_COEFFICIENT, INDOOR_OFFSET, SHADOWING_SIGMA)
+from wireless_singlehouse import SINGLEHOUSE_SHADOWING
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ('numpy', 'numba')
+
+def resolve_backend(backend='auto'):
+
+    """
+    :param backend: 'numpy', 'numba' or 'auto' (numba when it is installed)
+    :return: name of the backend that will actually run, numpy if numba is not installed
+    """
+    if backend is None or backend == 'auto':
+        return 'numba' if numba is not None else 'numpy'
+    if backend not in BACKENDS:
+        sys.exit("Unknown compute backend: {}".format(backend))
+    if backend == 'numba' and numba is None:
+        print("Numba is not installed, falling back to the numpy backend")
+        return 'numpy'
+    return backend
+
+def get_kernel_key(key):
+
+    """
+    :param key: key of the shadowing draws (shadowing.get_shadowing_key), None for single houses
+    :return: the key as the uint64 array the numba kernels take
+    """
+    if key is None:
+        return np.zeros(2, dtype=np.uint64)
+    return np.asarray(key, dtype=np.uint64)
+
+def tile_shadowing(key, rows, cols, n, nf):
+
+    """
+    :param key: key of the run, see shadowing.get_shadowing_key
+    :param rows: consecutive node ids of the tile rows
+    :param cols: consecutive node ids of the tile columns
+    :param n: number of nodes
+    :param nf: number of floors in each building
+    :return: (len(rows) x len(cols)) shadowing values in dB, 0 inside a building. The part of a
+             row above the diagonal is a slice of the condensed vector, drawn with
+             shadowing.range_normals; pairs below it (diagonal tiles) are taken from the
+             transposed tile, or drawn pair by pair if rows and cols differ
+    """
+    ldb = np.zeros((len(rows), len(cols)))
+    first_above = np.searchsorted(cols, rows, side='right')
+    for a, c in enumerate(first_above):
+        if c < len(cols):
+            k0 = int(condensed_index(n, rows[a], cols[c]))
+            ldb[a, c:] = SHADOWING_SIGMA * shadowing.range_normals(key, k0, k0 + len(cols) - c)
+    below = rows[:, None] > cols[None, :]
+    if below.any():
+        if np.array_equal(rows, cols):
+            ldb += ldb.T
+        else:
+            li, lj = np.nonzero(below)
+            ldb[li, lj] = wa.pair_shadowing(key, n, rows[li], cols[lj])
+    ldb[(rows[:, None] // nf) == (cols[None, :] // nf)] = 0
+    return ldb
+
+def _numpy_capacity_tile(scenario, crds, rows, cols, bn, nf, txp, key):
+
+    diff = crds[rows][:, None, :] - crds[cols][None, :, :]
+    dist = np.round(np.sqrt(np.einsum('ijk,ijk->ij', diff, diff)), 2)
+    ints = coordinates.get_intersection_counts(rows[:, None], cols[None, :], bn, nf)
+    self_pairs = rows[:, None] == cols[None, :]
+    with np.errstate(divide='ignore'):
+        if scenario == 'singlehouse':
+            pathloss = ws.calculate_pathloss_for_residential_area(dist, ints)
+        else:
+            same_building = (rows[:, None] // nf) == (cols[None, :] // nf)
+            pathloss = wa.calculate_mean_pathloss(dist, ints, same_building) + tile_shadowing(key, rows, cols, bn * nf, nf)
+    capacity = wa.calculate_link_capacity(txp, pathloss)
+    capacity[self_pairs] = 0
+    return capacity
+
+if numba is not None:
+
+    # the Philox block function of shadowing.py is compiled as it is, so both backends
+    # draw the same values
+    numba.extending.register_jitable(shadowing._mulhilo)
+    numba.extending.register_jitable(philox4x64)
+
+    @numba.njit(cache=True)
+    def _numba_pair_shadowing(key, i, j, n, r):
+
+        # scalar version of wireless_apartments.pair_shadowing (shadowing.pair_normals)
+        lo, hi = min(i, j), max(i, j)
+        k = n * lo - (lo * (lo + 1)) // 2 + (hi - lo - 1)
+        x0, x1, x2, x3 = philox4x64(key[0], key[1], np.uint64(k // 2 + 1), np.uint64(r), np.uint64(0), np.uint64(0))
+        if k % 2 == 1:
+            x0, x1 = x2, x3
+        u1 = (x0 >> np.uint64(11)) * UNIT_53
+        u2 = (x1 >> np.uint64(11)) * UNIT_53
+        return SHADOWING_SIGMA * np.sqrt(-2.0 * np.log(1.0 - u1)) * np.cos(2.0 * np.pi * u2)
+
+    @numba.njit(cache=True)
+    def _numba_pair_pathloss(crds, i, j, bn, nf, singlehouse, key):
+
+        # same models and constants as calculate_pathloss_for_residential_area and
+        # calculate_pathloss_for_apartments, evaluated for a single pair without temporaries
+        # (numba freezes the module-level constants at compile time)
+        dx = crds[i, 0] - crds[j, 0]
+        dy = crds[i, 1] - crds[j, 1]
+        dz = crds[i, 2] - crds[j, 2]
+        d = np.rint(np.sqrt(dx * dx + dy * dy + dz * dz) * 100.0) / 100.0
+        total_nodes = bn * nf
+        node_eachside = total_nodes // 2
+        if i // nf == j // nf and not singlehouse:
+            return 20 * np.log10(INDOOR_FREQUENCY_MHZ) + INDOOR_DISTANCE_COEFFICIENT * np.log10(d) + INDOOR_OFFSET
+        b = 0
+        if (i < node_eachside) == (j < node_eachside):
+            bi = (i if i < node_eachside else total_nodes - 1 - i) // nf
+            bj = (j if j < node_eachside else total_nodes - 1 - j) // nf
+            b = max(abs(bi - bj) - 1, 0)
+        ldb = SINGLEHOUSE_SHADOWING if singlehouse else _numba_pair_shadowing(key, i, j, total_nodes, 0)
+        return (RESIDENTIAL_ALPHA * np.log10(d) + RESIDENTIAL_BETA + RESIDENTIAL_GAMMA * np.log(FREQUENCY_GHZ) + ldb
+                + (b + 1) * BUILDING_ENTRY_LOSS)
+
+    @numba.njit(parallel=True, cache=True)
+    def _numba_capacity_tile(crds, rows, cols, bn, nf, singlehouse, txp, key, out):
+
+        for a in numba.prange(len(rows)):
+            for c in range(len(cols)):
+                if rows[a] == cols[c]:
+                    out[a, c] = 0.0
+                    continue
+                pathloss = _numba_pair_pathloss(crds, rows[a], cols[c], bn, nf, singlehouse, key)
+                out[a, c] = np.log2(1 + 10**((txp - pathloss) / 20))
+        return out
+
+    @numba.njit(parallel=True, cache=True)
+    def _numba_tile_edges(crds, rows, cols, bn, nf, singlehouse, txp, key, max_pathloss, upper):
+
+        # two passes over the tile: count the links of each row, then fill them in place.
+        # A pair is linked when its pathloss is below max_pathloss, so the capacity is only
+        # evaluated for the links themselves
+        counts = np.zeros(len(rows) + 1, dtype=np.int64)
+        for a in numba.prange(len(rows)):
+            k = 0
+            for c in range(a + 1 if upper else 0, len(cols)):
+                if rows[a] == cols[c]:
+                    continue
+                if _numba_pair_pathloss(crds, rows[a], cols[c], bn, nf, singlehouse, key) < max_pathloss:
+                    k += 1
+            counts[a + 1] = k
+        starts = np.cumsum(counts)
+        li = np.empty(starts[-1], dtype=np.int64)
+        lj = np.empty(starts[-1], dtype=np.int64)
+        cap = np.empty(starts[-1], dtype=np.float64)
+        for a in numba.prange(len(rows)):
+            k = starts[a]
+            for c in range(a + 1 if upper else 0, len(cols)):
+                if rows[a] == cols[c]:
+                    continue
+                pathloss = _numba_pair_pathloss(crds, rows[a], cols[c], bn, nf, singlehouse, key)
+                if pathloss < max_pathloss:
+                    li[k] = a
+                    lj[k] = c
+                    cap[k] = np.log2(1 + 10**((txp - pathloss) / 20))
+                    k += 1
+        return li, lj, cap
+
+    @numba.njit(parallel=True, cache=True)
+    def _numba_monte_carlo(key, realizations, n, sh_src, sh_dst, sh_margin, fixed_src, fixed_dst, link_count, n_links,
+                           connected):
+
+        # one realization at a time: the links are drawn per pair under prange into a reused
+        # buffer, then a union-find over the fixed and drawn links gives the connectivity
+        links = np.empty(len(sh_margin), dtype=np.bool_)
+        parent = np.empty(n, dtype=np.int64)
+        for r in range(realizations):
+            m = 0
+            for k in numba.prange(len(sh_margin)):
+                links[k] = _numba_pair_shadowing(key, sh_src[k], sh_dst[k], n, r) < sh_margin[k]
+                if links[k]:
+                    link_count[k] += 1
+                    m += 1
+            n_links[r] = m
+            for a in range(n):
+                parent[a] = a
+            merged = 0
+            for k in range(len(fixed_src) + len(sh_margin)):
+                if k < len(fixed_src):
+                    a, b = fixed_src[k], fixed_dst[k]
+                elif links[k - len(fixed_src)]:
+                    a, b = sh_src[k - len(fixed_src)], sh_dst[k - len(fixed_src)]
+                else:
+                    continue
+                while parent[a] != a:
+                    parent[a] = parent[parent[a]]
+                    a = parent[a]
+                while parent[b] != b:
+                    parent[b] = parent[parent[b]]
+                    b = parent[b]
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+                    merged += 1
+            connected[r] = merged == n - 1
+        return link_count, n_links, connected
+
+def capacity_tile(scenario, crds, rows, cols, bn, nf, txp, key=None, backend='numpy'):
+
+    """
+    :param scenario: 'apartment' or 'singlehouse'
+    :param crds: (n, 3) coordinate array of the nodes
+    :param rows: node ids of the tile rows
+    :param cols: node ids of the tile columns
+    :param bn: number of buildings (including both sides of the road)
+    :param nf: number of floors in each building
+    :param txp: trnsmission power of router
+    :param key: key of the shadowing draws, see shadowing.get_shadowing_key (apartments only)
+    :param backend: 'numpy' or 'numba', see resolve_backend
+    :return: (len(rows) x len(cols)) link capacity tile, 0 where a node meets itself
+    """
+    if resolve_backend(backend) == 'numpy':
+        return _numpy_capacity_tile(scenario, crds, rows, cols, bn, nf, txp, key)
+    singlehouse = scenario == 'singlehouse'
+    out = np.empty((len(rows), len(cols)))
+    return _numba_capacity_tile(crds, rows, cols, bn, nf, singlehouse, float(txp), get_kernel_key(key), out)
+
+def tile_edges(scenario, crds, rows, cols, bn, nf, txp, thr, key=None, upper=False, backend='numpy'):
+
+    """
+    Distance, shadowing, pathloss, capacity and threshold of a tile in one pass. With the numba
+    backend no tile-sized intermediate is allocated, only the links above thr.
+
+    :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :param upper: if True, only the pairs above the tile diagonal are kept (diagonal tiles)
+    :return: (row positions, column positions, capacity) of the links of the tile, positions are
+             relative to rows and cols
+    (the other parameters are those of capacity_tile)
+    """
+    if resolve_backend(backend) == 'numpy':
+        cap = _numpy_capacity_tile(scenario, crds, rows, cols, bn, nf, txp, key)
+        links = cap > thr
+        if upper:
+            links = np.triu(links, 1)
+        li, lj = np.nonzero(links)
+        return li, lj, cap[li, lj]
+    singlehouse = scenario == 'singlehouse'
+    max_pathloss = float(wa.calculate_max_pathloss(txp, thr))
+    return _numba_tile_edges(crds, rows, cols, bn, nf, singlehouse, float(txp), get_kernel_key(key), max_pathloss, upper)
+
+def monte_carlo_realizations(key, realizations, n, sh_src, sh_dst, sh_margin, fixed_src, fixed_dst):
+
+    """
+    Numba kernel of monte_carlo.monte_carlo_graph_info: draws the shadowed links of every
+    realization per pair (wireless_apartments.pair_shadowing) and checks connectivity with a
+    union-find, so no (realizations x pairs) array is allocated.
+
+    :param key: key of the shadowing draws, see shadowing.get_shadowing_key
+    :param realizations: number of realizations, numbered from 0
+    :param n: number of nodes
+    :param sh_src: first node of each pair subject to shadowing
+    :param sh_dst: second node of each pair subject to shadowing
+    :param sh_margin: largest shadowing value in dB with which each pair still forms a link
+    :param fixed_src: first node of each link that forms without shadowing
+    :param fixed_dst: second node of each link that forms without shadowing
+    :return: (number of realizations in which each shadowed pair is linked, number of shadowed
+             links of every realization, True for every realization with a connected graph)
+    """
+    link_count = np.zeros(len(sh_margin), dtype=np.int64)
+    n_links = np.zeros(realizations, dtype=np.int64)
+    connected = np.zeros(realizations, dtype=np.bool_)
+    return _numba_monte_carlo(get_kernel_key(key), realizations, n, sh_src.astype(np.int64), sh_dst.astype(np.int64),
+                              np.ascontiguousarray(sh_margin, dtype=np.float64), fixed_src.astype(np.int64),
+                              fixed_dst.astype(np.int64), link_count, n_links, connected)
@@ -0,0 +1,156 @@
+import sys
+import numpy as np
+import graph_ops
+import instrumentation
+import wireless_apartments as wa
+import wireless_singlehouse as ws
+
+class LatticeLinkTable(object):
+
+    """
+    Link values of a uniform street (fixed building width, two sides, identical
+    floor heights). On that lattice the distance, intersection count and pathloss
+    between two nodes only depend on (opposite sides or not, building offset
+    along the street, floor of each node), so they are computed once per distinct
+    value: 2 * (bn/2) * nf * nf entries instead of (bn*nf)^2.
+
+    table[side, offset, fa, fb] holds the value between a node on floor fa and a
+    node on floor fb, offset buildings further along the street. For side = 1
+    (opposite sides) fa is the floor of the node on the first side of the road.
+
+    The shadowing term is not translation invariant, so the apartment pathloss is
+    taken without it (the single-house model keeps its fixed shadowing).
+    """
+
+    def __init__(self, scenario, sw, bw, bn, nf, fh, txp):
+
+        if bn % 2 != 0:
+            sys.exit("The lattice mode needs the same number of buildings on both sides of the road")
+        if scenario == 'singlehouse':
+            nf, fh = 1, 0
+        self.scenario = scenario
+        self.bn = bn
+        self.nf = nf
+        self.m = bn // 2  # buildings on each side of the road
+        side = np.arange(2)[:, None, None, None]
+        offset = np.arange(self.m)[None, :, None, None]
+        fa = np.arange(nf)[None, None, :, None]
+        fb = np.arange(nf)[None, None, None, :]
+        dx = offset * float(bw)
+        dy = side * float(sw + bw)
+        dz = (fa - fb) * float(fh)
+        shape = (2, self.m, nf, nf)
+        self.distance = np.round(np.sqrt(dx**2 + dy**2 + dz**2), 2) * np.ones(shape)
+        self.intersection = np.broadcast_to(np.where(side == 0, np.maximum(offset - 1, 0), 0), shape).astype(np.int16)
+        self_pairs = np.broadcast_to((side == 0) & (offset == 0) & (fa == fb), shape)
+        with np.errstate(divide='ignore'):
+            if scenario == 'singlehouse':
+                self.pathloss = ws.calculate_pathloss_for_residential_area(self.distance, self.intersection)
+            else:
+                same_building = np.broadcast_to((side == 0) & (offset == 0), shape)
+                self.pathloss = wa.calculate_mean_pathloss(self.distance, self.intersection, same_building)
+        self.capacity = wa.calculate_link_capacity(txp, self.pathloss)
+        self.capacity[self_pairs] = 0
+
+    def locate(self, node):
+
+        """
+        :param node: node id(s)
+        :return: (side of the road, building position along the street, floor) of the node(s)
+        """
+        node = np.asarray(node)
+        building = node // self.nf
+        return building // self.m, building % self.m, node % self.nf
+
+    def node_id(self, side, pos, floor):
+
+        """
+        :return: node id(s) of the given side, building position along the street and floor
+        """
+        return (side * self.m + pos) * self.nf + floor
+
+    def lookup(self, table, i, j):
+
+        """
+        :param table: one of the distance, intersection, pathloss or capacity tables
+        :param i: node id(s) of the first end
+        :param j: node id(s) of the second end
+        :return: value(s) of the table between i and j
+        """
+        si, pi, fi = self.locate(i)
+        sj, pj, fj = self.locate(j)
+        opposite = (si != sj).astype(int)
+        # order each pair so that fa belongs to the node on the first side (opposite
+        # sides) or to the node earlier along the street (same side)
+        swap = np.where(opposite == 1, si > sj, pi > pj)
+        fa = np.where(swap, fj, fi)
+        fb = np.where(swap, fi, fj)
+        return table[opposite, np.abs(pi - pj), fa, fb]
+
+    def capacity_between(self, i, j):
+
+        """
+        :param i: node id(s) of the first end
+        :param j: node id(s) of the second end
+        :return: link capacity between i and j
+        """
+        return self.lookup(self.capacity, i, j)
+
+    @instrumentation.instrument('edges', count=lambda adj: adj.nnz)
+    def graph(self, thr, weighted=False):
+
+        """
+        :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router)
+        :param weighted: if True, the adjacency matrix holds the link capacities as edge weights
+        :return: symmetric scipy.sparse CSR adjacency matrix, built from the linked table entries only
+        """
+        m = self.m
+        linked = self.capacity > thr
+        # same building: only one orientation of every floor pair
+        linked[0, 0] &= np.triu(np.ones((self.nf, self.nf), dtype=bool), 1)
+        srcs, dsts = [], []
+        # kind 0: same side, q = p + offset; kind 1: opposite, q = p + offset; kind 2: opposite, q = p - offset
+        for kind in range(3):
+            side = 0 if kind == 0 else 1
+            ent = np.argwhere(linked[side])
+            if kind == 2:
+                ent = ent[ent[:, 0] > 0]
+            offset, fa, fb = ent[:, 0], ent[:, 1], ent[:, 2]
+            counts = m - offset
+            rep = np.repeat(np.arange(len(ent)), counts)
+            local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            off, fa, fb = offset[rep], fa[rep], fb[rep]
+            if kind == 0:
+                for s in range(2):
+                    srcs.append(self.node_id(s, local, fa))
+                    dsts.append(self.node_id(s, local + off, fb))
+            elif kind == 1:
+                srcs.append(self.node_id(0, local, fa))
+                dsts.append(self.node_id(1, local + off, fb))
+            else:
+                srcs.append(self.node_id(0, local + off, fa))
+                dsts.append(self.node_id(1, local, fb))
+        src = np.concatenate(srcs).astype(np.int32)
+        dst = np.concatenate(dsts).astype(np.int32)
+        weights = self.capacity_between(src, dst) if weighted else None
+        return graph_ops.pairs_to_adjacency(self.bn * self.nf, src, dst, weights)
+
+def lattice_apartments_graph_info(sw, bw, bn, nf, fh, txp, thr, weighted=False):
+
+    """
+    :return: CSR adjacency matrix of the apartment street, built from the lattice link table
+    """
+    return LatticeLinkTable('apartment', sw, bw, bn, nf, fh, txp).graph(thr, weighted=weighted)
+
+def lattice_singlehouse_graph_info(sw, bw, bn, txp, thr, weighted=False):
+
+    """
+    :return: CSR adjacency matrix of the single-house street, built from the lattice link table
+    """
+    return LatticeLinkTable('singlehouse', sw, bw, bn, 1, 0, txp).graph(thr, weighted=weighted)
+
+
+if __name__ == "__main__":
+
+    adj = lattice_apartments_graph_info(sw=20, bw=7, bn=20000, nf=8, fh=3.5, txp=20, thr=0.0005)
+    print("{} nodes, {} edges".format(adj.shape[0], adj.nnz // 2))
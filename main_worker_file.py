@@ -1,28 +1,49 @@
 import math
-import wireless_apartments as wa
-import wireless_singlehouse as ws
-import matplotlib.pyplot as plt
+import os
+import sys
 import configparser
-import networkx as nx
-
-def draw_graph(node_list, edge_list):
-
-    G = nx.Graph()
-    G.add_nodes_from(node_list)
-    G.add_edges_from(edge_list)
-    all_node_degrees = list(G.degree(node_list))
-    sum_degree = 0
-    for (u,v) in all_node_degrees:
-        sum_degree += float(v)
-    print("Average node degree: {}".format(sum_degree/len(node_list)))
-    print(len(G))
-    #nx.draw_shell(G, with_labels=True, node_size=200)
-    #plt.savefig('apartment_high.png')
-    #plt.show()
-    if nx.is_connected(G):
+import argparse
+import instrumentation
+
+# numpy, scipy and the scenario modules are imported where they are used, so that the
+# command line (--help, argument errors) starts without loading the numerical stack
+
+def draw_graph(node_list, graph, draw_file=None, graph_file=None, graph_format='npz', metadata=None, weights=None):
+
+    """
+    :param node_list: list of the node ids
+    :param graph: list of edge tuples, a scipy.sparse adjacency matrix or a BitAdjacency
+    :param draw_file: if given, the graph is drawn with networkx and saved to this image file
+    :param graph_file: file the graph is saved to when it is connected, not saved if None
+    :param graph_format: writer used for graph_file, see graph_io.GRAPH_WRITERS
+    :param metadata: dictionary of scenario parameters saved with the graph
+    :param weights: CondensedMatrix of the link capacities, stored in the drawn and saved graph of a BitAdjacency
+    :return: prints the degree and connectivity statistics, and saves the graph if it is connected
+    """
+    import graph_ops
+    import graph_io
+    n = len(node_list)
+    if graph_ops.sparse.issparse(graph) or isinstance(graph, graph_ops.BitAdjacency):
+        adj = graph
+    else:
+        adj = graph_ops.edge_list_to_adjacency(n, graph)
+    info = graph_ops.analyze_adjacency(adj)
+    print("Average node degree: {}".format(info['average_degree']))
+    print(n)
+    print("Connected components: {}, giant component size: {}".format(info['n_components'], info['giant_component_size']))
+    print("Degree histogram: {}".format(info['degree_histogram'].tolist()))
+    if isinstance(adj, graph_ops.BitAdjacency) and (draw_file is not None or (info['is_connected'] and graph_file is not None)):
+        adj = adj.to_sparse(weights)
+    if draw_file is not None:
+        import networkx as nx
+        import matplotlib.pyplot as plt
+        nx.draw_shell(graph_ops.adjacency_to_networkx(adj), with_labels=True, node_size=200)
+        plt.savefig(draw_file)
+    if info['is_connected'] and graph_file is not None:
         print("graph is being saved")
-        print(len(G))
-        nx.write_yaml(G, 'singlehouse_extreme.yaml')
+        print(n)
+        graph_io.save_graph(graph_file, adj, metadata, fmt=graph_format)
+    return info
 
 def count_building_numbers(stlen, bw):
 
@@ -35,10 +56,130 @@ def count_building_numbers(stlen, bw):
     return 2*bn
 
 
-def main():
+def print_monte_carlo_summary(result):
 
-    config = configparser.ConfigParser()
-    config.read('config.ini')
+    """
+    :param result: dictionary returned by monte_carlo.monte_carlo_graph_info
+    :return: prints the connectivity and degree statistics of the Monte Carlo run
+    """
+    avg_deg = result['average_degree']
+    print("Realizations: {}".format(len(avg_deg)))
+    print("Probability of a connected graph: {}".format(result['connected_probability']))
+    print("Average node degree: mean {}, std {}, min {}, max {}".format(avg_deg.mean(), avg_deg.std(), avg_deg.min(), avg_deg.max()))
+    link_prob = result['link_probability']
+    print("Links formed with probability > 0.5: {}".format(int((link_prob.data > 0.5).sum())))
+
+
+def apply_overrides(config, overrides):
+
+    """
+    :param config: parsed configuration
+    :param overrides: list of 'SECTION.Key=Value' strings
+    :return: the configuration with every override set (sections are created if needed)
+    """
+    for item in overrides:
+        name, sep, value = item.partition('=')
+        section, dot, key = name.strip().rpartition('.')
+        if not sep or not dot or not section or not key:
+            sys.exit("Overrides must look like SECTION.Key=Value, got {}".format(item))
+        if not config.has_section(section):
+            config.add_section(section)
+        config.set(section, key, value.strip())
+    return config
+
+# files written by run_scenarios, each may hold {job}
+OUTPUT_OPTIONS = (('OUTPUT', 'GraphFile'), ('OUTPUT', 'DrawFile'), ('STREAMING', 'EdgeFile'), ('CURVE', 'Output'),
+                  ('WIDESTPATH', 'Output'))
+
+def set_job_outputs(config, job, suffix=True):
+
+    """
+    :param config: parsed configuration
+    :param job: job number of a --batch run, 1 for a single run
+    :param suffix: if True, output paths without {job} get _job<number> before their extension,
+                   so that the jobs of a batch do not overwrite each other's files
+    :return: the configuration with {job} of every output path replaced by the job number
+    """
+    for section, key in OUTPUT_OPTIONS:
+        value = config.get(section, key, fallback='').strip()
+        if not value:
+            continue
+        if suffix and '{job}' not in value:
+            root, ext = os.path.splitext(value)
+            value = root + '_job{job}' + ext
+        config.set(section, key, value.replace('{job}', str(job)))
+    return config
+
+def read_link_parameters(config):
+
+    """
+    :param config: parsed configuration (see config.ini)
+    :return: dictionary with the street, building, router and content parameters of a run,
+             the threshold thr and the number of buildings bn derived from them
+    """
+    b_w = float(config['BUILDING']['BuildingWidth'])
+    rsp = float(config['ROUTER']['Speed']) * 10**6
+    cbtrt = float(config['CONTENT']['Bitrate']) * 1000
+    params = {'sw': float(config['STREET']['StreetWidth']), 'bw': b_w, 'fh': float(config['BUILDING']['FloorHeight']),
+              'nf': int(config['BUILDING']['FloorNumbers']), 'txp': float(config['ROUTER']['TxPower']),
+              'thr': float(cbtrt/rsp), 'bn': count_building_numbers(stlen=float(config['STREET']['StreetLength']), bw=b_w),
+              'seed': config.getint('MONTECARLO', 'Seed', fallback=None)}
+    return params
+
+def build_scenario_graph(config, scenario, cache=None, storage=None):
+
+    """
+    :param config: parsed configuration (see config.ini)
+    :param scenario: 'singlehouse' or 'apartment'
+    :param cache: GeometryCache of the cached pipeline
+    :param storage: 'auto', 'sparse' or 'bitpacked' adjacency of the parallel and cached pipelines,
+                    [GRAPH] Storage if None (see graph_ops.condensed_to_graph)
+    :return: (weighted CSR adjacency matrix or BitAdjacency, CondensedMatrix of the link capacity or None)
+             of the scenario in the configured single-run mode: SINR, lattice, range pruning, parallel or
+             the cached pipeline. The lattice, range pruning and SINR modes do not keep the capacity of
+             every pair and always return a CSR matrix. The shadowing is drawn from [MONTECARLO] Seed
+             (see shadowing.py), so the modes that draw every pair give the same graph
+    """
+    import graph_ops
+    import geometry_cache as gcache
+    p = read_link_parameters(config)
+    sw, bw, bn, txp, thr = p['sw'], p['bw'], p['bn'], p['txp'], p['thr']
+    nf, fh = (1, 0) if scenario == 'singlehouse' else (p['nf'], p['fh'])
+    workers = config.getint('PARALLEL', 'Workers', fallback=1)
+    if config.getboolean('SINR', 'Enabled', fallback=False):
+        sinr_options = {'activity': config.getfloat('SINR', 'Activity', fallback=1.0),
+                        'n_channels': config.getint('SINR', 'Channels', fallback=1),
+                        'channel_mode': config.get('SINR', 'ChannelAssignment', fallback='node').strip().lower(),
+                        'interference': config.get('SINR', 'Interference', fallback='expected').strip().lower()}
+        import sinr
+        return sinr.sinr_graph_info(scenario, sw, bw, bn, nf, fh, txp, thr, weighted=True, seed=p['seed'], cache=cache,
+                                    **sinr_options), None
+    if config.getboolean('SCENARIO', 'Lattice', fallback=False):
+        import lattice
+        return lattice.LatticeLinkTable(scenario, sw, bw, bn, nf, fh, txp).graph(thr, weighted=True), None
+    if config.getboolean('SCENARIO', 'RangePruning', fallback=False):
+        import range_pruning as rp
+        if scenario == 'singlehouse':
+            return rp.pruned_singlehouse_graph_info(sw, bw, bn, txp, thr, weighted=True), None
+        return rp.pruned_apartments_graph_info(sw, bw, bn, nf, fh, txp, thr, weighted=True, seed=p['seed']), None
+    if workers != 1:
+        import parallel
+        l_mat = parallel.parallel_pairwise(scenario, sw, bw, bn, nf, fh, txp=txp, workers=workers or None, seed=p['seed'])
+    else:
+        l_mat = gcache.cached_link_capacity(scenario, sw, bw, bn, nf, fh, txp, seed=p['seed'], cache=cache)
+    if storage is None:
+        storage = config.get('GRAPH', 'Storage', fallback='auto').strip().lower()
+    return graph_ops.condensed_to_graph(l_mat, thr, weighted=True, storage=storage), l_mat
+
+def run_scenarios(config, cache=None):
+
+    """
+    :param config: parsed configuration (see config.ini)
+    :param cache: GeometryCache shared between runs, a new one is made from the [CACHE] section if None
+    :return: runs the selected scenarios in the selected mode and prints their statistics
+    """
+    import numpy as np
+    import geometry_cache as gcache
     st_length = float(config['STREET']['StreetLength'])
     st_w = float(config['STREET']['StreetWidth'])
     b_w = float(config['BUILDING']['BuildingWidth'])
@@ -53,16 +194,159 @@ def main():
     bn = count_building_numbers(stlen=st_length, bw=b_w) # total number of buildings on both sides of the road
     scenrsh = config['SCENARIO'].getboolean('SingleHouse')
     scenra = config['SCENARIO'].getboolean('Apartment')
+    draw_file = config.get('OUTPUT', 'DrawFile', fallback='').strip() or None
+    graph_format = config.get('OUTPUT', 'GraphFormat', fallback='npz').strip().lower()
+    graph_file = config.get('OUTPUT', 'GraphFile', fallback='{scenario}_graph.{ext}').strip() or None
+    if graph_file is not None:
+        # the extension follows GraphFormat, {scenario} is filled in for each scenario
+        graph_file = graph_file.replace('{ext}', graph_format)
+    metadata = {'StreetLength': st_length, 'StreetWidth': st_w, 'BuildingWidth': b_w, 'FloorNumbers': nf,
+                'FloorHeight': a_h, 'TxPower': txp, 'Speed': float(config['ROUTER']['Speed']),
+                'Bitrate': float(config['CONTENT']['Bitrate']), 'Buildings': bn, 'Threshold': thr}
+    if cache is None:
+        cache = gcache.GeometryCache(cache_dir=config.get('CACHE', 'Directory', fallback='').strip() or None)
+    mc_runs = config.getint('MONTECARLO', 'Realizations', fallback=0)
+    mc_seed = config.getint('MONTECARLO', 'Seed', fallback=None)
+    tile = config.getint('STREAMING', 'TileSize', fallback=0)
+    if config.getboolean('SCENARIO', 'CityGrid', fallback=False):
+        n_streets = config.getint('CITYGRID', 'Streets', fallback=3)
+        n_avenues = config.getint('CITYGRID', 'Avenues', fallback=3)
+        block = config.getfloat('CITYGRID', 'BlockLength', fallback=80.0)
+        import city_grid
+        for (selected, scenario) in ((scenrsh, 'singlehouse'), (scenra, 'apartment')):
+            if selected:
+                print("{} scenario selected on a grid of {} streets and {} avenues".format(scenario, n_streets, n_avenues))
+                adj, layout = city_grid.city_grid_graph_info(scenario, n_streets, n_avenues, block, st_w, b_w, nf, a_h, txp, thr,
+                                                             weighted=True, seed=mc_seed, cache=cache)
+                grid_metadata = dict(metadata, Scenario='citygrid_' + scenario, Streets=n_streets, Avenues=n_avenues,
+                                     BlockLength=block, Buildings=len(layout['footprints']))
+                draw_graph(list(range(adj.shape[0])), adj, draw_file=draw_file,
+                           graph_file=graph_file and graph_file.format(scenario='citygrid_' + scenario),
+                           graph_format=graph_format, metadata=grid_metadata)
+        return
+    if tile > 0:
+        edge_file = config.get('STREAMING', 'EdgeFile', fallback='{scenario}_edges.bin').strip()
+        backend = config.get('STREAMING', 'Backend', fallback='auto').strip().lower()
+        import tiled
+        for (selected, scenario, n_floors) in ((scenrsh, 'singlehouse', 1), (scenra, 'apartment', nf)):
+            if selected:
+                print("{} scenario selected, computed in tiles of {} nodes".format(scenario, tile))
+                edge_path = edge_file.format(scenario=scenario)
+                cap, n_edges = tiled.tiled_link_capacity(scenario, st_w, b_w, bn, n_floors, a_h, txp, thr=thr, tile=tile,
+                                                         edge_path=edge_path, seed=mc_seed, backend=backend)
+                print("Average node degree: {}".format(2.0 * n_edges / (bn * n_floors)))
+                print("{} edges written to {}".format(n_edges, edge_path))
+        return
+    solve = config.get('SOLVER', 'Solve', fallback='').strip().lower()
+    if solve:
+        target = config.get('SOLVER', 'Target', fallback='connected').strip().lower()
+        units = {'txpower': 'dBm', 'bitrate': 'kbps', 'speed': 'Mbps'}
+        import solver
+        for (selected, scenario, n_floors) in ((scenrsh, 'singlehouse', 1), (scenra, 'apartment', nf)):
+            if selected:
+                value = solver.solve_link_budget(scenario, st_w, b_w, bn, n_floors, a_h, txp, float(config['ROUTER']['Speed']),
+                                                 float(config['CONTENT']['Bitrate']), solve=solve, target=target,
+                                                 seed=mc_seed, cache=cache)
+                print("{} scenario, critical {} for target '{}': {:.4f} {}".format(scenario, solve, target, value, units.get(solve, '')))
+        return
+    curve_file = config.get('CURVE', 'Output', fallback='').strip()
+    if curve_file:
+        import threshold_curve
+        for (selected, scenario, n_floors) in ((scenrsh, 'singlehouse', 1), (scenra, 'apartment', nf)):
+            if selected:
+                l_mat = gcache.cached_link_capacity(scenario, st_w, b_w, bn, n_floors, a_h, txp,
+                                                    seed=mc_seed, cache=cache)
+                curve = threshold_curve.threshold_sweep(l_mat)
+                path = curve_file.format(scenario=scenario)
+                threshold_curve.write_threshold_curve(path, curve, speed=float(config['ROUTER']['Speed']))
+                print("{} scenario, connected for thresholds below {} (configured threshold {})".format(
+                    scenario, curve['connectivity_threshold'], thr))
+                print("Threshold curve written to {}".format(path))
+        return
+    widest_file = config.get('WIDESTPATH', 'Output', fallback='').strip()
+    if widest_file:
+        import widest_path
+        for (selected, scenario, n_floors) in ((scenrsh, 'singlehouse', 1), (scenra, 'apartment', nf)):
+            if selected:
+                l_mat = gcache.cached_link_capacity(scenario, st_w, b_w, bn, n_floors, a_h, txp,
+                                                    seed=mc_seed, cache=cache)
+                widest, stats = widest_path.all_pairs_widest_path(l_mat, threshold=thr)
+                path = widest_file.format(scenario=scenario)
+                np.savez(path, widest_path=widest.data, **stats)
+                print("{} scenario, pairs reachable over relays: {} of {}".format(scenario, int((widest.data > thr).sum()), len(widest.data)))
+                print("Busiest relay: node {} on {} widest paths".format(int(np.argmax(stats['relay_pairs'])), int(stats['relay_pairs'].max())))
+                print("Widest-path capacities written to {}".format(path))
+        return
+    if mc_runs > 0:
+        import monte_carlo as mc
+        backend = config.get('STREAMING', 'Backend', fallback='auto').strip().lower()
+        if scenrsh:
+            print("Singlehouse scenario selected, {} shadowing realizations".format(mc_runs))
+            geom = mc.get_pair_geometry(st_w, b_w, bn, nf=1, fh=0)
+            print_monte_carlo_summary(mc.monte_carlo_graph_info(geom, txp, thr, mc_runs, seed=mc_seed, backend=backend))
+        if scenra:
+            print("Apartment scenario selected, {} shadowing realizations".format(mc_runs))
+            geom = mc.get_pair_geometry(st_w, b_w, bn, nf, a_h)
+            print_monte_carlo_summary(mc.monte_carlo_graph_info(geom, txp, thr, mc_runs, seed=mc_seed, backend=backend))
+        return
     if scenrsh:
         print("Singlehouse scenario selected")
-        edge_list = ws.wireless_singlehouse_graph_info(st_w, b_w, bn, txp, thr)
+        adj, l_mat = build_scenario_graph(config, 'singlehouse', cache=cache)
         node_list = [x for x in range(bn)]
-        draw_graph(node_list, edge_list)
+        metadata['Scenario'] = 'singlehouse'
+        draw_graph(node_list, adj, draw_file=draw_file, graph_file=graph_file and graph_file.format(scenario='singlehouse'),
+                   graph_format=graph_format, metadata=dict(metadata), weights=l_mat)
     if scenra:
         print("Apartment scenario selected")
-        edge_list = wa.wireless_apartments_graph_info(st_w, b_w, bn, nf, a_h, txp, thr)
+        adj, l_mat = build_scenario_graph(config, 'apartment', cache=cache)
         node_list = [x for x in range(bn*nf)]
-        draw_graph(node_list, edge_list)
+        metadata['Scenario'] = 'apartment'
+        draw_graph(node_list, adj, draw_file=draw_file, graph_file=graph_file and graph_file.format(scenario='apartment'),
+                   graph_format=graph_format, metadata=dict(metadata), weights=l_mat)
+
+def main(argv=None):
+
+    """
+    :param argv: command line arguments, sys.argv[1:] if None
+    :return: runs the scenarios of the configuration file, or of every job of a batch file
+             sequentially in this process so that the geometry cache is shared between them.
+             Batch jobs print and save their full output, to files of their own (see
+             set_job_outputs); results are not cached, see batch_runner.py for the
+             content-addressed result store
+    """
+    parser = argparse.ArgumentParser(description="Wireless link capacity in a dense urban street")
+    parser.add_argument('config', nargs='?', default='config.ini', help="configuration file (default config.ini)")
+    parser.add_argument('--set', dest='overrides', action='append', default=[], metavar='SECTION.Key=VALUE',
+                        help="override a configuration value, can be repeated")
+    parser.add_argument('--batch', metavar='FILE', help="run every job of FILE, one line of .ini files and/or "
+                                                        "SECTION.Key=VALUE overrides per job, seeded like batch_runner.py "
+                                                        "but without reading or writing its result store. Output paths "
+                                                        "are made per job with {job}, or get a _job<number> suffix")
+    parser.add_argument('--instrument', action='store_true', help="report time, memory and element counts of every pipeline stage")
+    parser.add_argument('--profile', metavar='FILE', help="dump cProfile statistics of the run to FILE")
+    args = parser.parse_args(argv)
+    config = configparser.ConfigParser()
+    if not config.read(args.config):
+        sys.exit("Configuration file {} could not be read".format(args.config))
+    apply_overrides(config, args.overrides)
+    enabled = args.instrument or config.getboolean('INSTRUMENTATION', 'Enabled', fallback=False)
+    profile_file = args.profile or config.get('INSTRUMENTATION', 'ProfileFile', fallback='').strip() or None
+    if enabled:
+        instrumentation.recorder.enable(trace_memory=config.getboolean('INSTRUMENTATION', 'TraceMemory', fallback=True))
+    with instrumentation.profile(profile_file):
+        if args.batch:
+            import batch_runner
+            import geometry_cache as gcache
+            jobs = [apply_overrides(job, args.overrides) for job in batch_runner.read_jobs(args.batch, args.config)]
+            cache = gcache.GeometryCache(cache_dir=config.get('CACHE', 'Directory', fallback='').strip() or None)
+            for index, job in enumerate(jobs):
+                print("=== job {} of {} ===".format(index + 1, len(jobs)))
+                run_scenarios(set_job_outputs(job, index + 1), cache=cache)
+        else:
+            run_scenarios(set_job_outputs(config, 1, suffix=False))
+    if enabled:
+        print(instrumentation.recorder.report())
+        instrumentation.recorder.disable()
 
 if __name__ == "__main__":
 
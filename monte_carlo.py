@@ -0,0 +1,120 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+import coordinates
+import instrumentation
+import kernels
+import shadowing
+import wireless_apartments as wa
+from condensed import CondensedMatrix, condensed_size, iter_pair_blocks
+
+@instrumentation.instrument('pair_geometry', count=lambda geom: len(geom['src']))
+def get_pair_geometry(sw, bw, bn, nf, fh):
+
+    """
+    :param sw: width of the street (in meter)
+    :param bw: width of a single building (in meter)
+    :param bn: number of buildings (including both sides of the road)
+    :param nf: number of floors in each building
+    :param fh: height of each floor
+    :return: dictionary with the node pairs (i < j) in condensed order, their pathloss without
+    shadowing (CondensedMatrix) and a mask of the pairs that are subject to shadowing (nodes in
+    different buildings)
+    """
+    total_nodes = bn * nf
+    allc = coordinates.get_all_coordinates(sw, bw, bn, nf, fh)
+    dist = coordinates.get_condensed_distance_matrix(allc)
+    ints = coordinates.get_condensed_intersection_matrix(bn, nf)
+    src = np.empty(condensed_size(total_nodes), dtype=np.int32)
+    dst = np.empty(condensed_size(total_nodes), dtype=np.int32)
+    for k0, k1, b_src, b_dst in iter_pair_blocks(total_nodes):
+        src[k0:k1] = b_src
+        dst[k0:k1] = b_dst
+    geometry = {}
+    geometry['n'] = total_nodes
+    geometry['src'] = src
+    geometry['dst'] = dst
+    geometry['mean_pathloss'] = wa.calculate_condensed_mean_pathloss(dist, ints, nf)
+    geometry['shadowed'] = (src // nf) != (dst // nf)
+    return geometry
+
+@instrumentation.instrument('monte_carlo', count=lambda res: len(res['average_degree']))
+def monte_carlo_graph_info(geometry, txp, thr, realizations, seed=None, batch_bytes=2**27, backend='numpy'):
+
+    """
+    :param geometry: pair geometry returned by get_pair_geometry
+    :param txp: trnsmission power of router
+    :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :param realizations: number of independent shadowing realizations
+    :param seed: seed of the shadowing draws (see shadowing.py). Realization r is drawn from the
+                 numpy.random.Philox stream r of the seed, and realization 0 is the graph of the
+                 single run with the same seed; the result does not depend on the backend
+    :param batch_bytes: upper bound on the memory used by one slice of shadowing draws (numpy backend)
+    :param backend: 'numpy' draws each realization in slices of the condensed vector, 'numba' draws
+                    every pair inside the kernel and checks connectivity with a union-find, see
+                    kernels.resolve_backend
+    :return: dictionary with
+        link_probability - CondensedMatrix of the probability that each link exceeds the threshold
+        average_degree - average node degree of every realization
+        connected_probability - fraction of the realizations in which the graph is connected
+    """
+    key = shadowing.get_shadowing_key(seed)
+    n = geometry['n']
+    src = geometry['src']
+    dst = geometry['dst']
+    shadowed = geometry['shadowed']
+    # a link forms when pathloss < max_pathloss, i.e. when the shadowing draw
+    # stays below the remaining margin of the pair
+    margin = wa.calculate_max_pathloss(txp, thr) - geometry['mean_pathloss'].data
+    fixed_links = ~shadowed & (margin > 0)
+    sh_margin = margin[shadowed]
+    sh_src = src[shadowed]
+    sh_dst = dst[shadowed]
+    fixed_src = src[fixed_links]
+    fixed_dst = dst[fixed_links]
+
+    link_count = np.zeros(len(sh_margin), dtype=np.int64)
+    average_degree = np.empty(realizations)
+    n_connected = 0
+    if kernels.resolve_backend(backend) == 'numba':
+        link_count, n_links, connected = kernels.monte_carlo_realizations(key, realizations, n, sh_src, sh_dst,
+                                                                          sh_margin, fixed_src, fixed_dst)
+        average_degree[:] = 2.0 * (n_links + len(fixed_src)) / n
+        n_connected = int(connected.sum())
+    else:
+        # a realization is drawn a slice of the condensed vector at a time, the draws keep
+        # about four 8-byte temporaries per pair
+        sh_k = np.flatnonzero(shadowed)
+        step = max(1, int(batch_bytes // 32))
+        bounds = np.searchsorted(sh_k, np.arange(0, len(margin) + step, step))
+        links = np.empty(len(sh_margin), dtype=bool)
+        for r in range(realizations):
+            for s, k0 in enumerate(range(0, len(margin), step)):
+                a, b = bounds[s], bounds[s + 1]
+                ldb = wa.SHADOWING_SIGMA * shadowing.range_normals(key, k0, min(k0 + step, len(margin)), r)
+                links[a:b] = ldb[sh_k[a:b] - k0] < sh_margin[a:b]
+            link_count += links
+            average_degree[r] = 2.0 * (links.sum() + len(fixed_src)) / n
+            rows = np.concatenate((fixed_src, sh_src[links]))
+            cols = np.concatenate((fixed_dst, sh_dst[links]))
+            adj = sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+            n_components = csgraph.connected_components(adj, directed=False, return_labels=False)
+            if n_components == 1:
+                n_connected += 1
+
+    link_probability = CondensedMatrix(np.zeros(len(margin)), n)
+    link_probability.data[fixed_links] = 1.0
+    link_probability.data[shadowed] = link_count / float(realizations)
+    result = {}
+    result['link_probability'] = link_probability
+    result['average_degree'] = average_degree
+    result['connected_probability'] = n_connected / float(realizations)
+    return result
+
+
+if __name__ == "__main__":
+
+    geom = get_pair_geometry(sw=20, bw=4, bn=8, nf=3, fh=3)
+    res = monte_carlo_graph_info(geom, txp=25, thr=0.0007, realizations=1000, seed=1)
+    print("Probability of a connected graph: {}".format(res['connected_probability']))
+    print("Average node degree: {} (std {})".format(np.mean(res['average_degree']), np.std(res['average_degree'])))
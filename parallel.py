@@ -0,0 +1,133 @@
+import os
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import coordinates
+import graph_ops
+import instrumentation
+import shadowing
+import wireless_apartments as wa
+import wireless_singlehouse as ws
+from condensed import CondensedMatrix, condensed_size, get_row_blocks, get_block_pairs, get_row_starts
+
+# state of a pool worker, set once by init_worker so that the blocks only carry row ranges
+_worker = {}
+
+def init_worker(shm_name, size, crds, scenario, bn, nf, txp, key):
+
+    """
+    Keeps the run parameters of a pool worker, including the name of the shared output vector.
+    """
+    _worker['row_start'] = get_row_starts(len(crds))
+    _worker.update(shm_name=shm_name, size=size, crds=crds, scenario=scenario, bn=bn, nf=nf, txp=txp, key=key)
+
+def compute_row_block(r0, r1):
+
+    """
+    :param r0: first row of the block
+    :param r1: end row of the block (excluded)
+    :return: number of pairs written into the shared output
+
+    The rows of a block are the condensed slice [k0, k1), whose shadowing is drawn with
+    shadowing.range_normals, so the values are those of the single-process pipeline and do
+    not depend on which worker computes the block, or on how many there are.
+    The shared output is attached for the block only and closed before returning, so that
+    workers hold no handle on it once the parent unlinks it.
+    """
+    crds, nf = _worker['crds'], _worker['nf']
+    k0, k1, src, dst = get_block_pairs(len(crds), r0, r1, _worker['row_start'])
+    dist = coordinates.get_pair_distances(crds, src, dst)
+    ints = coordinates.get_intersection_counts(src, dst, _worker['bn'], nf)
+    if _worker['scenario'] == 'singlehouse':
+        values = ws.calculate_pathloss_for_residential_area(dist, ints)
+    else:
+        same_building = (src // nf) == (dst // nf)
+        ldb = wa.SHADOWING_SIGMA * shadowing.range_normals(_worker['key'], k0, k1)
+        ldb[same_building] = 0
+        values = wa.calculate_mean_pathloss(dist, ints, same_building)
+        values += ldb
+    if _worker['txp'] is not None:
+        values = wa.calculate_link_capacity(_worker['txp'], values)
+    shm = shared_memory.SharedMemory(name=_worker['shm_name'])
+    try:
+        out = np.ndarray((_worker['size'],), dtype=np.float64, buffer=shm.buf)
+        out[k0:k1] = values
+        del out
+    finally:
+        shm.close()
+    return k1 - k0
+
+@instrumentation.instrument('parallel_pairwise', count=lambda mat: len(mat.data))
+def parallel_pairwise(scenario, sw, bw, bn, nf, fh, txp=None, workers=None, block_pairs=2**22, seed=None):
+
+    """
+    Pathloss (or link capacity) of every pair of nodes, computed in row blocks of the
+    condensed upper triangle on a process pool. Workers write their block straight into
+    a multiprocessing.shared_memory vector, so no matrix is pickled between processes.
+
+    :param scenario: 'apartment' or 'singlehouse' (nf and fh are ignored for single houses)
+    :param sw: width of the street (in meter)
+    :param bw: width of a single building (in meter)
+    :param bn: number of buildings (including both sides of the road)
+    :param nf: number of floors in each building
+    :param fh: height of each floor
+    :param txp: trnsmission power of router, if given the link capacity is returned instead of the pathloss
+    :param workers: number of worker processes, os.cpu_count() if None, 1 computes in this process
+    :param block_pairs: upper bound on the pairs of one block
+    :param seed: seed of the shadowing draws, the values of wireless_apartments.draw_condensed_shadowing
+    :return: CondensedMatrix of the pathloss in dB, or of the link capacity if txp is given
+    """
+    if scenario == 'singlehouse':
+        nf, fh = 1, 0
+    n = bn * nf
+    size = condensed_size(n)
+    crds = coordinates.get_coordinate_array(coordinates.get_all_coordinates(sw, bw, bn, nf, fh))
+    key = shadowing.get_shadowing_key(seed)
+    blocks = get_row_blocks(n, block_pairs)
+    workers = workers or os.cpu_count()
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1) * np.dtype(np.float64).itemsize)
+    try:
+        initargs = (shm.name, size, crds, scenario, bn, nf, txp, key)
+        with np.errstate(divide='ignore'):
+            if workers == 1:
+                init_worker(*initargs)
+                try:
+                    for r0, r1 in blocks:
+                        compute_row_block(r0, r1)
+                finally:
+                    _worker.clear()
+            else:
+                # spawned workers: forking a process that already runs numba or BLAS threads can deadlock
+                with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs,
+                                         mp_context=multiprocessing.get_context('spawn')) as pool:
+                    futures = [pool.submit(compute_row_block, r0, r1) for r0, r1 in blocks]
+                    for fut in futures:
+                        fut.result()
+        data = np.ndarray((size,), dtype=np.float64, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return CondensedMatrix(data, n)
+
+def parallel_apartments_graph_info(sw, bw, bn, nf, fh, txp, thr, weighted=False, workers=None, seed=None):
+
+    """
+    :return: CSR adjacency matrix of the apartment street, with the capacities computed by parallel_pairwise
+    """
+    l_mat = parallel_pairwise('apartment', sw, bw, bn, nf, fh, txp=txp, workers=workers, seed=seed)
+    return graph_ops.condensed_to_adjacency(l_mat, thr, weighted=weighted)
+
+def parallel_singlehouse_graph_info(sw, bw, bn, txp, thr, weighted=False, workers=None):
+
+    """
+    :return: CSR adjacency matrix of the single-house street, with the capacities computed by parallel_pairwise
+    """
+    l_mat = parallel_pairwise('singlehouse', sw, bw, bn, 1, 0, txp=txp, workers=workers)
+    return graph_ops.condensed_to_adjacency(l_mat, thr, weighted=weighted)
+
+
+if __name__ == "__main__":
+
+    cap = parallel_pairwise('apartment', sw=20, bw=7, bn=1000, nf=8, fh=3.5, txp=20, seed=1)
+    print("{} pairs computed".format(len(cap.data)))
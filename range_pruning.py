@@ -0,0 +1,129 @@
+import sys
+import numpy as np
+import coordinates
+import graph_ops
+import wireless_apartments as wa
+import wireless_singlehouse as ws
+import instrumentation
+import shadowing
+
+# shadowing draws are truncated at this many dB, i.e. 4 standard deviations of
+# N(0, 5.06), so that the link range below is a hard bound
+SHADOW_BOUND = 4 * wa.SHADOWING_SIGMA
+
+def check_threshold(thr):
+
+    """
+    :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :return: exits if thr is not positive, every pair would then be a link and there is no link range
+    """
+    if not thr > 0:
+        sys.exit("Range pruning needs a positive threshold (Bitrate > 0), got {}".format(thr))
+
+def calculate_max_link_distance(txp, thr, shadow_bound=SHADOW_BOUND):
+
+    """
+    :param txp: trnsmission power of router
+    :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :param shadow_bound: largest shadowing gain in dB that a link can get
+    :return: distance (in meter) beyond which no link can exceed the threshold, with either pathloss model
+    """
+    check_threshold(thr)
+    max_pl = wa.calculate_max_pathloss(txp, thr)
+    # both models are affine in log10(d): loss(d) = loss(1) + slope * log10(d)
+    res_intercept = wa.calculate_pathloss_for_residential_area(1.0, 0, ldb=-shadow_bound)
+    res_slope = wa.calculate_pathloss_for_residential_area(10.0, 0, ldb=0) - wa.calculate_pathloss_for_residential_area(1.0, 0, ldb=0)
+    apt_intercept = wa.calculate_pathloss_for_apartments(1.0)
+    apt_slope = wa.calculate_pathloss_for_apartments(10.0) - apt_intercept
+    d_res = 10**((max_pl - res_intercept) / res_slope)
+    d_apt = 10**((max_pl - apt_intercept) / apt_slope)
+    return max(d_res, d_apt)
+
+def calculate_max_building_count(txp, thr, bw, shadow_bound=SHADOW_BOUND):
+
+    """
+    :param txp: trnsmission power of router
+    :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :param bw: width of a single building (in meter)
+    :param shadow_bound: largest shadowing gain in dB that a link can get
+    :return: largest number of intervening buildings a link can cross and still exceed the threshold
+    """
+    check_threshold(thr)
+    max_pl = wa.calculate_max_pathloss(txp, thr)
+    # with b buildings in between, the two nodes are at least (b + 1) * bw apart
+    b = 0
+    while wa.calculate_pathloss_for_residential_area((b + 2) * bw, b + 1, ldb=-shadow_bound) < max_pl:
+        b += 1
+    return b
+
+@instrumentation.instrument('candidate_pairs', count=lambda pairs: len(pairs[0]))
+def find_candidate_pairs(crds, max_distance):
+
+    """
+    :param crds: (n, 3) coordinate array of the nodes
+    :param max_distance: largest distance at which a pair can form a link
+    :return: node ids (src, dst) with src < dst of all the pairs within max_distance
+    """
+    from scipy.spatial import cKDTree
+    tree = cKDTree(crds)
+    # distances are rounded to 2 decimals before the pathloss is evaluated
+    pairs = tree.query_pairs(max_distance + 0.005, output_type='ndarray')
+    return pairs[:, 0], pairs[:, 1]
+
+def pruned_apartments_graph_info(sw, bw, bn, nf, fh, txp, thr, weighted=False, seed=None, shadow_bound=SHADOW_BOUND):
+
+    """
+    :param sw: width of the street (in meter)
+    :param bw: width of a building (in meter)
+    :param bn: number of buildings in total on both sides of street
+    :param nf: number of floors in each building
+    :param fh: height of each floor
+    :param txp: trnsmission power of router
+    :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :param weighted: if True, the adjacency matrix holds the link capacities as edge weights
+    :param seed: seed of the shadowing draw; the candidate pairs get the values they have in the
+                 full condensed draw (wireless_apartments.pair_shadowing)
+    :param shadow_bound: shadowing draws are clipped to [-shadow_bound, shadow_bound] dB
+    :return: scipy.sparse CSR adjacency matrix, only the pairs within link range are evaluated
+    """
+    crds = coordinates.get_coordinate_array(coordinates.get_all_coordinates(sw, bw, bn, nf, fh))
+    src, dst = find_candidate_pairs(crds, calculate_max_link_distance(txp, thr, shadow_bound))
+    ints = coordinates.get_intersection_counts(src, dst, bn, nf)
+    keep = ints <= calculate_max_building_count(txp, thr, bw, shadow_bound)
+    src, dst, ints = src[keep], dst[keep], ints[keep]
+    same_building = (src // nf) == (dst // nf)
+    dist = coordinates.get_pair_distances(crds, src, dst)
+    ldb = np.clip(wa.pair_shadowing(shadowing.get_shadowing_key(seed), bn * nf, src, dst), -shadow_bound, shadow_bound)
+    ldb[same_building] = 0
+    capacity = wa.calculate_link_capacity(txp, wa.calculate_mean_pathloss(dist, ints, same_building) + ldb)
+    links = capacity > thr
+    return graph_ops.pairs_to_adjacency(bn * nf, src[links], dst[links], capacity[links] if weighted else None)
+
+def pruned_singlehouse_graph_info(sw, bw, bn, txp, thr, weighted=False):
+
+    """
+    :param sw: width of the street (in meter)
+    :param bw: width of a building (in meter)
+    :param bn: number of buildings in total on both sides of street
+    :param txp: trnsmission power of router
+    :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :param weighted: if True, the adjacency matrix holds the link capacities as edge weights
+    :return: scipy.sparse CSR adjacency matrix, only the pairs within link range are evaluated
+    """
+    # the single-house model uses a fixed shadowing term
+    shadow_bound = -ws.SINGLEHOUSE_SHADOWING
+    crds = coordinates.get_coordinate_array(coordinates.get_all_coordinates(sw, bw, bn, nf=1, fh=0))
+    src, dst = find_candidate_pairs(crds, calculate_max_link_distance(txp, thr, shadow_bound))
+    ints = coordinates.get_intersection_counts(src, dst, bn)
+    keep = ints <= calculate_max_building_count(txp, thr, bw, shadow_bound)
+    src, dst, ints = src[keep], dst[keep], ints[keep]
+    dist = coordinates.get_pair_distances(crds, src, dst)
+    capacity = ws.calculate_link_capacity(txp, ws.calculate_pathloss_for_residential_area(dist, ints))
+    links = capacity > thr
+    return graph_ops.pairs_to_adjacency(bn, src[links], dst[links], capacity[links] if weighted else None)
+
+
+if __name__ == "__main__":
+
+    adj = pruned_apartments_graph_info(sw=20, bw=7, bn=2000, nf=8, fh=3.5, txp=20, thr=0.0005)
+    print("{} nodes, {} edges".format(adj.shape[0], adj.nnz // 2))
@@ -0,0 +1,106 @@
+import numpy as np
+
+# Philox4x64-10 constants (Random123), the counter-based bit generator behind numpy.random.Philox
+PHILOX_M0 = np.uint64(0xD2E7470EE14C6C93)
+PHILOX_M1 = np.uint64(0xCA5A826395121157)
+PHILOX_W0 = np.uint64(0x9E3779B97F4A7C15)
+PHILOX_W1 = np.uint64(0xBB67AE8584CAA73B)
+PHILOX_ROUNDS = 10
+LOW_32 = np.uint64(0xFFFFFFFF)
+UNIT_53 = 2.0**-53
+
+# Shadowing draws shared by every path of the pipeline (single run, process pool, tiles,
+# Monte Carlo, range pruning, numba kernels). The pair at position k of the condensed vector
+# takes the uniforms 2k and 2k+1 of
+#     numpy.random.Generator(numpy.random.Philox(key=key, counter=[0, realization, 0, 0])).random()
+# and turns them into one N(0, 1) value with the Box-Muller transform. Philox is counter based,
+# so the value of a pair only depends on the key, the realization and k, never on the order,
+# the blocks or the tiles in which the pairs are computed.
+
+def get_shadowing_key(seed=None):
+
+    """
+    :param seed: seed of the run ([MONTECARLO] Seed), fresh entropy if None
+    :return: Philox key (two uint64) of the shadowing draws of the run
+    """
+    return np.random.SeedSequence(seed).generate_state(2, np.uint64)
+
+def box_muller(u1, u2):
+
+    """
+    :param u1: uniform values in [0, 1)
+    :param u2: uniform values in [0, 1)
+    :return: N(0, 1) values, sqrt(-2 log(1 - u1)) * cos(2 pi u2)
+    """
+    return np.sqrt(-2.0 * np.log(1.0 - u1)) * np.cos(2.0 * np.pi * u2)
+
+def range_normals(key, k0, k1, realization=0):
+
+    """
+    :param key: key of the draws, see get_shadowing_key
+    :param k0: condensed position of the first pair
+    :param k1: condensed position of the end pair (excluded)
+    :param realization: realization number (Monte Carlo), 0 for a single run
+    :return: N(0, 1) values of the pairs k0 .. k1 - 1, drawn with numpy.random.Philox
+    """
+    skip = k0 % 2
+    gen = np.random.Generator(np.random.Philox(key=key, counter=[k0 // 2, realization, 0, 0]))
+    u = gen.random(2 * (k1 - k0 + skip))[2 * skip:]
+    return box_muller(u[0::2], u[1::2])
+
+def _mulhilo(a, b):
+
+    # 64 x 64 -> 128 bit product as (high, low) words, from 32 bit halves
+    a0, a1 = a & LOW_32, a >> np.uint64(32)
+    b0, b1 = b & LOW_32, b >> np.uint64(32)
+    p00, p01, p10 = a0 * b0, a0 * b1, a1 * b0
+    mid = (p00 >> np.uint64(32)) + (p01 & LOW_32) + (p10 & LOW_32)
+    hi = a1 * b1 + (p01 >> np.uint64(32)) + (p10 >> np.uint64(32)) + (mid >> np.uint64(32))
+    return hi, a * b
+
+def philox4x64(key0, key1, c0, c1, c2, c3):
+
+    """
+    Philox4x64-10 block function, written with plain integer operations so that it runs on
+    numpy arrays and compiles unchanged with numba (kernels.py).
+
+    :param key0: low word of the key
+    :param key1: high word of the key
+    :param c0: counter words, lowest first (uint64 scalars or arrays)
+    :return: the four uint64 outputs of the counter
+    """
+    for r in range(PHILOX_ROUNDS):
+        if r > 0:
+            key0 = key0 + PHILOX_W0
+            key1 = key1 + PHILOX_W1
+        hi0, lo0 = _mulhilo(PHILOX_M0, c0)
+        hi1, lo1 = _mulhilo(PHILOX_M1, c2)
+        c0, c1, c2, c3 = hi1 ^ c1 ^ key0, lo1, hi0 ^ c3 ^ key1, lo0
+    return c0, c1, c2, c3
+
+def pair_normals(key, k, realization=0, max_values=2**18):
+
+    """
+    :param key: key of the draws, see get_shadowing_key
+    :param k: condensed positions of the pairs, in any order
+    :param realization: realization number(s), broadcast against k
+    :param max_values: upper bound on the values evaluated at once, the Philox rounds keep a few
+                       dozen temporaries per value
+    :return: N(0, 1) values of the pairs, equal to those of range_normals
+    """
+    k, realization = np.broadcast_arrays(np.asarray(k, dtype=np.uint64), np.asarray(realization, dtype=np.uint64))
+    key = np.asarray(key, dtype=np.uint64)
+    k_flat, r_flat = k.ravel(), realization.ravel()
+    out = np.empty(k.shape)
+    out_flat = out.reshape(-1)
+    for s in range(0, len(k_flat), max_values):
+        kb = k_flat[s:s + max_values]
+        zero = np.zeros_like(kb)
+        with np.errstate(over='ignore'):
+            # numpy.random.Philox increments the counter before each block, block b uses counter b + 1
+            x0, x1, x2, x3 = philox4x64(key[0], key[1], kb // np.uint64(2) + np.uint64(1), r_flat[s:s + max_values], zero, zero)
+        odd = (kb % np.uint64(2)) == 1
+        u1 = (np.where(odd, x2, x0) >> np.uint64(11)) * UNIT_53
+        u2 = (np.where(odd, x3, x1) >> np.uint64(11)) * UNIT_53
+        out_flat[s:s + max_values] = box_muller(u1, u2)
+    return out
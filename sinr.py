@@ -0,0 +1,112 @@
+import sys
+import numpy as np
+import geometry_cache as gcache
+import graph_ops
+import instrumentation
+from condensed import CondensedMatrix, iter_pair_blocks
+
+CHANNEL_ASSIGNMENTS = ('node', 'building', 'random')
+INTERFERENCE_MODES = ('expected', 'drawn')
+
+def assign_channels(n, n_channels=1, mode='node', nf=1, rng=None):
+
+    """
+    :param n: total number of nodes
+    :param n_channels: number of non-overlapping channels (e.g. 3 for channels 1, 6 and 11 at 2.4 GHz)
+    :param mode: 'node' cycles the channels over the node ids, 'building' gives every router of a
+                 building the same channel and cycles over the buildings, 'random' draws them
+    :param nf: number of floors in each building
+    :param rng: numpy.random.Generator of the 'random' assignment
+    :return: channel of every node
+    """
+    if mode == 'node':
+        return np.arange(n) % n_channels
+    if mode == 'building':
+        return (np.arange(n) // nf) % n_channels
+    if mode == 'random':
+        if rng is None:
+            rng = np.random.default_rng()
+        return rng.integers(0, n_channels, size=n)
+    sys.exit("Unknown channel assignment: {}".format(mode))
+
+@instrumentation.instrument('sinr_capacity', count=lambda mat: len(mat.data))
+def calculate_sinr_link_capacity(pathloss, tx_power, activity=1.0, channels=None, rng=None):
+
+    """
+    Link capacity with the interference of the other routers on the same channel.
+
+    Powers follow calculate_link_capacity: the received amplitude 10^((tx_power - pathloss)/20)
+    is taken relative to a unit noise floor, so SINR = S / (1 + I) and activity = 0 gives the
+    interference-free capacities back. The interference at receiver j of a link i -> j is the
+    sum over the routers k != i on the channel of i, weighted by their activity:
+        I[c, j] = sum_k active_k * [channel_k == c] * S[k, j],   I_ij = I[channel_i, j] - active_i * S[i, j]
+    computed as one weighted bincount per block of pairs, so only condensed vectors are held.
+    A link has to work in both directions, so its capacity is the smaller of i -> j and j -> i.
+    A receiver only hears transmitters on its own channel, so routers on different channels
+    have no link (capacity 0): more channels remove interference but also split the graph.
+
+    :param pathloss: CondensedMatrix of the pathloss in dB between any two nodes
+    :param tx_power: tx power of every router in dBm
+    :param activity: probability that a router transmits at the same time
+    :param channels: channel of every node (see assign_channels), a single shared channel if None
+    :param rng: numpy.random.Generator; if given, one set of active routers is drawn with this
+                probability, otherwise the expected interference is used
+    :return: CondensedMatrix of the link capacity between any two nodes
+    """
+    n = pathloss.n
+    if channels is None:
+        channels = np.zeros(n, dtype=np.int64)
+    channels = np.asarray(channels, dtype=np.int64)
+    n_channels = int(channels.max()) + 1 if n > 0 else 1
+    if rng is not None:
+        active = (rng.random(n) < activity).astype(float)
+    else:
+        active = np.full(n, float(activity))
+    # interference of every channel at every receiver, flattened as channel * n + receiver
+    interference = np.zeros(n_channels * n)
+    for k0, k1, src, dst in iter_pair_blocks(n):
+        signal = 10**((tx_power - pathloss.data[k0:k1]) / 20)
+        interference += np.bincount(channels[src] * n + dst, weights=active[src] * signal, minlength=n_channels * n)
+        interference += np.bincount(channels[dst] * n + src, weights=active[dst] * signal, minlength=n_channels * n)
+    capacity = np.empty(len(pathloss.data))
+    for k0, k1, src, dst in iter_pair_blocks(n):
+        signal = 10**((tx_power - pathloss.data[k0:k1]) / 20)
+        sinr_forward = signal / (1 + interference[channels[src] * n + dst] - active[src] * signal)
+        sinr_backward = signal / (1 + interference[channels[dst] * n + src] - active[dst] * signal)
+        block = np.log2(1 + np.minimum(sinr_forward, sinr_backward))
+        block[channels[src] != channels[dst]] = 0
+        capacity[k0:k1] = block
+    return CondensedMatrix(capacity, n)
+
+def sinr_graph_info(scenario, sw, bw, bn, nf, fh, txp, thr, activity=1.0, n_channels=1, channel_mode='node',
+                    interference='expected', weighted=False, seed=None, cache=None):
+
+    """
+    :param scenario: 'apartment' or 'singlehouse' (nf and fh are ignored for single houses)
+    :param activity: probability that a router transmits at the same time
+    :param n_channels: number of non-overlapping channels
+    :param channel_mode: channel assignment, see assign_channels
+    :param interference: 'expected' weights every interferer by activity, 'drawn' draws one set of
+                         active routers (see calculate_sinr_link_capacity)
+    :param seed: seed of the shadowing draw, of the random channel assignment and of the drawn active set
+    :return: CSR adjacency matrix of the links whose SINR capacity exceeds thr
+    """
+    if interference not in INTERFERENCE_MODES:
+        sys.exit("Unknown interference mode: {}".format(interference))
+    if scenario == 'singlehouse':
+        nf, fh = 1, 0
+    rng = np.random.default_rng(seed)
+    pathloss = gcache.cached_pathloss(scenario, sw, bw, bn, nf, fh, seed=seed, cache=cache)
+    channels = assign_channels(pathloss.n, n_channels, channel_mode, nf, rng)
+    l_mat = calculate_sinr_link_capacity(pathloss, txp, activity=activity, channels=channels,
+                                         rng=rng if interference == 'drawn' else None)
+    return graph_ops.condensed_to_adjacency(l_mat, thr, weighted=weighted)
+
+
+if __name__ == "__main__":
+
+    for n_channels in (1, 3):
+        adj = sinr_graph_info('apartment', sw=20, bw=7, bn=40, nf=4, fh=3.5, txp=20, thr=0.0005, activity=0.1,
+                              n_channels=n_channels, seed=1)
+        info = graph_ops.analyze_adjacency(adj)
+        print("{} channel(s): average degree {:.2f}, {} component(s)".format(n_channels, info['average_degree'], info['n_components']))
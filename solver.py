@@ -0,0 +1,150 @@
+import sys
+import numpy as np
+import geometry_cache as gcache
+import graph_ops
+import instrumentation
+import wireless_apartments as wa
+from condensed import condensed_to_pairs
+
+class LinkBudgetSolver(object):
+
+    """
+    Inverse of the link budget: the lowest TxPower, or the highest bitrate / lowest router
+    speed, for which the street is connected or reaches a target average degree.
+
+    A pair is linked when its pathloss is below calculate_max_pathloss(txp, thr), so for
+    every (txp, thr) the edge set is a prefix of the pairs sorted by pathloss. The pairs
+    are sorted once; one union-find pass over them gives the exact prefix length at which
+    the street becomes connected, and the critical pathloss of that prefix is converted
+    back to txp, thr or speed.
+    """
+
+    def __init__(self, scenario, sw, bw, bn, nf, fh, seed=None, cache=None):
+
+        """
+        :param scenario: 'apartment' or 'singlehouse' (nf and fh are ignored for single houses)
+        :param seed: seed of the apartment shadowing draw
+        :param cache: GeometryCache to use, the module-level default_cache if None
+        """
+        if scenario == 'singlehouse':
+            nf, fh = 1, 0
+        if cache is None:
+            cache = gcache.default_cache
+        pathloss = cache.get(scenario, sw, bw, bn, nf, fh)['pathloss']
+        self.n = pathloss.n
+        values = pathloss.data
+        if scenario != 'singlehouse':
+            values = values + wa.draw_condensed_shadowing(self.n, seed, nf).data
+        order = np.argsort(values, kind='stable')
+        self.pathloss = values[order]
+        self.src, self.dst = condensed_to_pairs(self.n, order)
+        self._connected_edges = None
+
+    def edge_count(self, max_pathloss):
+
+        """
+        :param max_pathloss: largest pathloss of a link in dB
+        :return: number of links, the length of the sorted prefix below max_pathloss
+        """
+        return int(np.searchsorted(self.pathloss, max_pathloss, side='left'))
+
+    def is_connected(self, k):
+
+        """
+        :param k: number of links, taken from the start of the sorted pairs
+        :return: True if the graph of the first k links is connected
+        """
+        # adding links never disconnects the graph, so every prefix at least as long
+        # as the connecting one is connected
+        return self.n > 0 and k >= self.required_edges('connected')
+
+    def required_edges(self, target='connected'):
+
+        """
+        :param target: 'connected', or the average node degree to reach
+        :return: smallest number of links (taken in pathloss order) that meets the target
+        """
+        if target != 'connected':
+            k = int(np.ceil(float(target) * self.n / 2))
+            if k > len(self.pathloss):
+                sys.exit("An average degree of {} is not reachable with {} nodes".format(target, self.n))
+            return max(k, 1)
+        if self._connected_edges is None:
+            # links are added in pathloss order until a single component is left; if the
+            # street never connects, every pair is needed
+            uf = graph_ops.UnionFind(self.n)
+            self._connected_edges = len(self.pathloss) if self.n > 1 else 0
+            for k, (a, b) in enumerate(zip(self.src.tolist(), self.dst.tolist())):
+                uf.union(a, b)
+                if uf.n_components == 1:
+                    self._connected_edges = k + 1
+                    break
+        return self._connected_edges
+
+    def critical_pathloss(self, target='connected'):
+
+        """
+        :param target: 'connected', or the average node degree to reach
+        :return: pathloss in dB of the last link needed, the target is met as soon as the
+                 maximum link pathloss exceeds it
+        """
+        return float(self.pathloss[self.required_edges(target) - 1])
+
+    def min_tx_power(self, thr, target='connected'):
+
+        """
+        :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router)
+        :return: TxPower in dBm above which the target is met
+        """
+        return self.critical_pathloss(target) + 20 * np.log10(2**thr - 1)
+
+    def max_threshold(self, txp, target='connected'):
+
+        """
+        :param txp: trnsmission power of router
+        :return: threshold (video_bitrate/B) below which the target is met
+        """
+        return float(wa.calculate_link_capacity(txp, self.critical_pathloss(target)))
+
+    def max_bitrate(self, txp, speed, target='connected'):
+
+        """
+        :param txp: trnsmission power of router
+        :param speed: router speed in Mbps
+        :return: content bitrate in kbps below which the target is met
+        """
+        return self.max_threshold(txp, target) * speed * 10**6 / 1000
+
+    def min_speed(self, txp, bitrate, target='connected'):
+
+        """
+        :param txp: trnsmission power of router
+        :param bitrate: content bitrate in kbps
+        :return: router speed in Mbps above which the target is met
+        """
+        return bitrate * 1000 / self.max_threshold(txp, target) / 10**6
+
+@instrumentation.instrument('solver')
+def solve_link_budget(scenario, sw, bw, bn, nf, fh, txp, speed, bitrate, solve='txpower', target='connected',
+                      seed=None, cache=None):
+
+    """
+    :param solve: 'txpower', 'bitrate' or 'speed', the parameter to solve for (the others are kept)
+    :param target: 'connected', or the average node degree to reach
+    :return: critical value of the solved parameter (dBm, kbps or Mbps)
+    """
+    solver = LinkBudgetSolver(scenario, sw, bw, bn, nf, fh, seed=seed, cache=cache)
+    if solve == 'txpower':
+        return solver.min_tx_power(bitrate * 1000 / (speed * 10**6), target)
+    if solve == 'bitrate':
+        return solver.max_bitrate(txp, speed, target)
+    if solve == 'speed':
+        return solver.min_speed(txp, bitrate, target)
+    sys.exit("Unknown solver parameter: {}".format(solve))
+
+
+if __name__ == "__main__":
+
+    solver = LinkBudgetSolver('apartment', sw=20, bw=7, bn=200, nf=8, fh=3.5, seed=1)
+    print("Minimum TxPower for a connected street at 500 kbps / 1000 Mbps: {:.2f} dBm".format(solver.min_tx_power(0.0005)))
+    print("Maximum bitrate for a connected street at 20 dBm / 1000 Mbps: {:.1f} kbps".format(solver.max_bitrate(20, 1000)))
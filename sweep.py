@@ -0,0 +1,212 @@
+import configparser
+import csv
+import itertools
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import monte_carlo as mc
+import main_worker_file as mwf
+
+# (section, key) of every parameter that can be swept, in output column order
+SWEEP_PARAMETERS = [('STREET', 'StreetLength'), ('STREET', 'StreetWidth'), ('BUILDING', 'BuildingWidth'),
+                    ('BUILDING', 'FloorNumbers'), ('BUILDING', 'FloorHeight'), ('ROUTER', 'TxPower'),
+                    ('ROUTER', 'Speed'), ('CONTENT', 'Bitrate')]
+GEOMETRY_PARAMETERS = ['StreetLength', 'StreetWidth', 'BuildingWidth', 'FloorNumbers', 'FloorHeight']
+METRICS = ['average_degree', 'connected_probability', 'edge_count']
+
+
+def parse_sweep_spec(spec):
+
+    """
+    :param spec: either a range 'start:stop:step' (stop included) or a list 'v1,v2,...'
+    :return: list of the values described by the spec
+    """
+    spec = spec.strip()
+    if ':' in spec:
+        parts = [float(x) for x in spec.split(':')]
+        if len(parts) != 3 or parts[2] <= 0:
+            sys.exit("Invalid sweep range '{}', expected start:stop:step".format(spec))
+        start, stop, step = parts
+        n_steps = int(np.floor((stop - start) / step + 1e-9))
+        return [round(start + k * step, 10) for k in range(n_steps + 1)]
+    return [float(x) for x in spec.split(',') if x.strip()]
+
+def read_base_parameters(config):
+
+    """
+    :param config: parsed configuration
+    :return: dictionary with the base value of every sweepable parameter
+    """
+    return {key: float(config[section][key]) for (section, key) in SWEEP_PARAMETERS}
+
+def read_sweep_ranges(config):
+
+    """
+    :param config: parsed configuration
+    :return: dictionary parameter -> list of values, for the parameters listed in [SWEEP]
+    """
+    ranges = {}
+    for (section, key) in SWEEP_PARAMETERS:
+        if config.has_option('SWEEP', key):
+            ranges[key] = parse_sweep_spec(config.get('SWEEP', key))
+    return ranges
+
+def generate_sweep_points(base, ranges, mode):
+
+    """
+    :param base: base value of every parameter
+    :param ranges: values to sweep for each varied parameter
+    :param mode: 'tornado' varies one parameter at a time around the base point, 'grid' runs every combination
+    :return: list of parameter dictionaries, one per point
+    """
+    points = []
+    if mode == 'grid':
+        keys = list(ranges)
+        for values in itertools.product(*[ranges[k] for k in keys]):
+            point = dict(base)
+            point.update(zip(keys, values))
+            points.append(point)
+    elif mode == 'tornado':
+        points.append(dict(base))
+        for key in ranges:
+            for value in ranges[key]:
+                if value != base[key]:
+                    point = dict(base)
+                    point[key] = value
+                    points.append(point)
+    else:
+        sys.exit("Unknown sweep mode '{}', expected tornado or grid".format(mode))
+    return points
+
+def group_points_by_geometry(points, scenario):
+
+    """
+    :param points: list of parameter dictionaries
+    :param scenario: 'apartment' or 'singlehouse'
+    :return: dictionary geometry key -> list of points sharing that street and building geometry
+    """
+    groups = {}
+    for point in points:
+        if scenario == 'singlehouse':
+            key = (point['StreetLength'], point['StreetWidth'], point['BuildingWidth'], 1, 0.0)
+        else:
+            key = tuple(point[k] for k in GEOMETRY_PARAMETERS)
+        groups.setdefault(key, []).append(point)
+    return groups
+
+def evaluate_geometry_group(scenario, key, points, realizations, seed):
+
+    """
+    :param scenario: 'apartment' or 'singlehouse'
+    :param key: geometry key (street length, street width, building width, floors, floor height)
+    :param points: points sharing this geometry
+    :param realizations: number of shadowing realizations per point
+    :param seed: seed of the shadowing draws, the same for every point
+    :return: list of result rows, one per point
+    """
+    st_length, st_w, b_w, nf, a_h = key
+    bn = mwf.count_building_numbers(stlen=st_length, bw=b_w)
+    geom = mc.get_pair_geometry(st_w, b_w, bn, int(nf), a_h)
+    rows = []
+    for point in points:
+        thr = (point['Bitrate'] * 1000) / (point['Speed'] * 10**6)
+        res = mc.monte_carlo_graph_info(geom, point['TxPower'], thr, realizations, seed=seed)
+        row = {'scenario': scenario}
+        row.update(point)
+        row['average_degree'] = float(np.mean(res['average_degree']))
+        row['connected_probability'] = res['connected_probability']
+        row['edge_count'] = row['average_degree'] * geom['n'] / 2
+        rows.append(row)
+    return rows
+
+def tornado_summary(rows, base, ranges, mode, metric='average_degree'):
+
+    """
+    :param rows: result rows of one scenario
+    :param base: base value of every parameter
+    :param ranges: values swept for each varied parameter
+    :param mode: sweep mode the rows come from
+    :param metric: result column the diagram is drawn for
+    :return: list of (parameter, low value, high value, metric at low, metric at high, swing), largest swing first
+    """
+    summary = []
+    for key in ranges:
+        if mode == 'tornado':
+            # one-at-a-time rows: every other parameter sits at its base value
+            subset = [r for r in rows if all(r[k] == base[k] for k in ranges if k != key)]
+        else:
+            subset = rows
+        per_value = {}
+        for r in subset:
+            per_value.setdefault(r[key], []).append(r[metric])
+        if len(per_value) < 2:
+            continue
+        means = {v: float(np.mean(per_value[v])) for v in per_value}
+        low, high = min(means), max(means)
+        swing = max(means.values()) - min(means.values())
+        summary.append((key, low, high, means[low], means[high], swing))
+    summary.sort(key=lambda item: item[5], reverse=True)
+    return summary
+
+def write_sweep_results(path, rows, summaries):
+
+    """
+    :param path: output file
+    :param rows: result rows of all scenarios
+    :param summaries: dictionary scenario -> tornado summary, written as comment lines on top of the table
+    :return: writes a single CSV table with one column per parameter and metric
+    """
+    columns = ['scenario'] + [key for (section, key) in SWEEP_PARAMETERS] + METRICS
+    with open(path, 'w', newline='') as f:
+        for scenario in summaries:
+            f.write("# tornado diagram ({}, average_degree): parameter, low, high, metric at low, metric at high, swing\n".format(scenario))
+            for item in summaries[scenario]:
+                f.write("# {}, {}, {}, {:.4f}, {:.4f}, {:.4f}\n".format(*item))
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({c: row[c] for c in columns})
+
+def run_sweep(config_path='config.ini'):
+
+    """
+    :param config_path: configuration file with a [SWEEP] section
+    :return: list of result rows, after writing them to the configured output file
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    if not config.has_section('SWEEP'):
+        sys.exit("No [SWEEP] section in {}".format(config_path))
+    mode = config.get('SWEEP', 'Mode', fallback='tornado').strip().lower()
+    workers = config.getint('SWEEP', 'Workers', fallback=None)
+    output = config.get('SWEEP', 'Output', fallback='sweep_results.csv')
+    realizations = max(1, config.getint('MONTECARLO', 'Realizations', fallback=1))
+    seed = config.getint('MONTECARLO', 'Seed', fallback=None)
+    base = read_base_parameters(config)
+    ranges = read_sweep_ranges(config)
+    points = generate_sweep_points(base, ranges, mode)
+    scenarios = []
+    if config['SCENARIO'].getboolean('SingleHouse'):
+        scenarios.append('singlehouse')
+    if config['SCENARIO'].getboolean('Apartment'):
+        scenarios.append('apartment')
+
+    rows = []
+    summaries = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for scenario in scenarios:
+            groups = group_points_by_geometry(points, scenario)
+            futures = [pool.submit(evaluate_geometry_group, scenario, key, groups[key], realizations, seed) for key in groups]
+            scen_rows = []
+            for fut in futures:
+                scen_rows.extend(fut.result())
+            summaries[scenario] = tornado_summary(scen_rows, base, ranges, mode)
+            rows.extend(scen_rows)
+    write_sweep_results(output, rows, summaries)
+    print("{} points written to {}".format(len(rows), output))
+    return rows
+
+
+if __name__ == "__main__":
+
+    run_sweep(sys.argv[1] if len(sys.argv) > 1 else 'config.ini')
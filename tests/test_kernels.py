@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+import coordinates
+import kernels
+import monte_carlo as mc
+import shadowing
+
+pytest.importorskip('numba')
+
+SW, BW, BN, NF, FH, TXP, SEED = 20, 7, 12, 4, 3.5, 20, 5
+
+def test_tile_edges_backends_agree():
+
+    crds = coordinates.get_coordinate_array(coordinates.get_all_coordinates(SW, BW, BN, NF, FH))
+    key = shadowing.get_shadowing_key(SEED)
+    rows, cols = np.arange(0, 20), np.arange(10, 48)
+    for upper in (False, True):
+        res = [kernels.tile_edges('apartment', crds, rows, cols, BN, NF, TXP, 0.0005, key=key, upper=upper, backend=backend)
+               for backend in kernels.BACKENDS]
+        assert np.array_equal(res[0][0], res[1][0])
+        assert np.array_equal(res[0][1], res[1][1])
+        assert np.allclose(res[0][2], res[1][2], rtol=1e-12)
+
+def test_monte_carlo_backends_agree():
+
+    geometry = mc.get_pair_geometry(SW, BW, BN, NF, FH)
+    # a threshold at which the street is connected in some of the realizations only
+    res = [mc.monte_carlo_graph_info(geometry, 10, 0.0005, 40, seed=SEED, backend=backend) for backend in kernels.BACKENDS]
+    assert 0 < res[0]['connected_probability'] < 1
+    assert np.array_equal(res[0]['link_probability'].data, res[1]['link_probability'].data)
+    assert np.array_equal(res[0]['average_degree'], res[1]['average_degree'])
+    assert res[0]['connected_probability'] == res[1]['connected_probability']
@@ -0,0 +1,32 @@
+import configparser
+import os
+import numpy as np
+import main_worker_file as mwf
+import parallel
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.ini')
+
+def read_config(**overrides):
+
+    config = configparser.ConfigParser()
+    config.read(CONFIG_PATH)
+    mwf.apply_overrides(config, ['{}={}'.format(key, value) for key, value in overrides.items()])
+    return config
+
+def test_graph_does_not_depend_on_worker_count():
+
+    graphs = []
+    for workers in (1, 2, 3):
+        config = read_config(**{'BUILDING.FloorNumbers': 4, 'PARALLEL.Workers': workers, 'MONTECARLO.Seed': 7})
+        adj, l_mat = mwf.build_scenario_graph(config, 'apartment', storage='sparse')
+        graphs.append(adj.tocsr())
+    for adj in graphs[1:]:
+        assert np.array_equal(adj.indptr, graphs[0].indptr)
+        assert np.array_equal(adj.indices, graphs[0].indices)
+        assert np.array_equal(adj.data, graphs[0].data)
+
+def test_blocks_do_not_change_the_values():
+
+    a = parallel.parallel_pairwise('apartment', 20, 7, 8, 3, 3.5, txp=20, workers=1, block_pairs=5, seed=7)
+    b = parallel.parallel_pairwise('apartment', 20, 7, 8, 3, 3.5, txp=20, workers=2, block_pairs=50, seed=7)
+    assert np.array_equal(a.data, b.data)
@@ -0,0 +1,46 @@
+import numpy as np
+import geometry_cache as gcache
+import monte_carlo as mc
+import range_pruning as rp
+import shadowing
+import tiled
+from condensed import condensed_to_pairs
+
+SW, BW, BN, NF, FH, TXP, THR, SEED = 20, 7, 12, 4, 3.5, 20, 0.0005, 5
+
+def get_reference_edges():
+
+    l_mat = gcache.cached_link_capacity('apartment', SW, BW, BN, NF, FH, TXP, seed=SEED)
+    src, dst = condensed_to_pairs(l_mat.n, np.flatnonzero(l_mat.data > THR))
+    return set(zip(src.tolist(), dst.tolist()))
+
+def test_pair_normals_match_numpy_philox():
+
+    key = shadowing.get_shadowing_key(SEED)
+    values = shadowing.range_normals(key, 0, 1001, realization=3)
+    assert np.array_equal(shadowing.range_normals(key, 17, 900, realization=3), values[17:900])
+    assert np.array_equal(shadowing.pair_normals(key, np.arange(1001), realization=3, max_values=64), values)
+    k = np.array([900, 3, 512])
+    assert np.array_equal(shadowing.pair_normals(key, k, realization=np.array([[3], [3]]))[1], values[k])
+
+def test_tiled_edges_match_single_run(tmp_path):
+
+    reference = get_reference_edges()
+    for tile in (7, 16, 100):
+        path = str(tmp_path / 'edges_{}.bin'.format(tile))
+        tiled.tiled_link_capacity('apartment', SW, BW, BN, NF, FH, TXP, thr=THR, tile=tile, edge_path=path, seed=SEED,
+                                  backend='numpy')
+        edges = tiled.load_edge_file(path, mmap=False)
+        assert set(zip(edges['src'].tolist(), edges['dst'].tolist())) == reference
+
+def test_first_realization_is_single_run():
+
+    geometry = mc.get_pair_geometry(SW, BW, BN, NF, FH)
+    res = mc.monte_carlo_graph_info(geometry, TXP, THR, 1, seed=SEED, backend='numpy')
+    assert res['average_degree'][0] == 2.0 * len(get_reference_edges()) / (BN * NF)
+
+def test_pruned_edges_match_single_run():
+
+    adj = rp.pruned_apartments_graph_info(SW, BW, BN, NF, FH, TXP, THR, seed=SEED).tocoo()
+    upper = adj.row < adj.col
+    assert set(zip(adj.row[upper].tolist(), adj.col[upper].tolist())) == get_reference_edges()
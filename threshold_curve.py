@@ -0,0 +1,69 @@
+import csv
+import numpy as np
+import graph_ops
+import instrumentation
+from condensed import condensed_to_pairs
+
+@instrumentation.instrument('threshold_curve', count=lambda curve: len(curve['threshold']))
+def threshold_sweep(l_mat, min_threshold=0.0):
+
+    """
+    Connectivity of the graph for every threshold at once. The links are sorted by
+    capacity in descending order and added to a union-find structure one by one;
+    lowering the threshold below a link's capacity adds exactly that link.
+
+    :param l_mat: CondensedMatrix of the link capacity between any two nodes
+    :param min_threshold: lowest threshold of the curve, only links above it are sorted
+    :return: dictionary with, for every distinct link capacity t in descending order
+        threshold - t, the graph at any threshold just below t holds the links >= t
+        n_components - number of connected components
+        giant_fraction - fraction of the nodes in the largest component
+        average_degree - mean node degree
+        and connectivity_threshold - the graph is connected for every threshold below it
+        (None if it is not connected even at min_threshold)
+    """
+    n = l_mat.n
+    keep = np.flatnonzero(l_mat.data > min_threshold)
+    order = keep[np.argsort(-l_mat.data[keep], kind='stable')]
+    capacity = l_mat.data[order]
+    src, dst = condensed_to_pairs(n, order)
+    components = np.ones(len(order), dtype=np.int64)
+    giant = np.full(len(order), n, dtype=np.int64)
+    uf = graph_ops.UnionFind(n)
+    connectivity_threshold = None
+    for k, (a, b) in enumerate(zip(src.tolist(), dst.tolist())):
+        uf.union(a, b)
+        components[k] = uf.n_components
+        giant[k] = uf.giant_component_size
+        if uf.n_components == 1:
+            # every further link stays inside the single component
+            connectivity_threshold = float(capacity[k])
+            break
+    # a run of equal capacities enters the graph together, keep the state after its last link
+    last = np.flatnonzero(np.append(capacity[1:] != capacity[:-1], True)) if len(capacity) > 0 else np.empty(0, dtype=np.int64)
+    curve = {}
+    curve['threshold'] = capacity[last]
+    curve['n_components'] = components[last]
+    curve['giant_fraction'] = giant[last] / float(n)
+    curve['average_degree'] = 2.0 * (last + 1) / n
+    curve['connectivity_threshold'] = connectivity_threshold
+    return curve
+
+def write_threshold_curve(path, curve, speed=None):
+
+    """
+    :param path: output CSV file
+    :param curve: result of threshold_sweep
+    :param speed: router speed in Mbps, adds the equivalent content bitrate (kbps) of every threshold
+    :return: writes one row per threshold, the connectivity threshold as a comment line on top
+    """
+    with open(path, 'w', newline='') as f:
+        f.write("# connectivity threshold: {}\n".format(curve['connectivity_threshold']))
+        writer = csv.writer(f)
+        columns = ['threshold', 'n_components', 'giant_fraction', 'average_degree']
+        writer.writerow(columns + (['bitrate'] if speed is not None else []))
+        for k in range(len(curve['threshold'])):
+            row = [curve[c][k] for c in columns]
+            if speed is not None:
+                row.append(curve['threshold'][k] * speed * 10**6 / 1000)
+            writer.writerow(row)
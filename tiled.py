@@ -0,0 +1,127 @@
+import sys
+import numpy as np
+import coordinates
+import instrumentation
+import kernels
+import shadowing
+
+# record layout of the on-disk edge file, one record per undirected edge (src < dst)
+EDGE_DTYPE = np.dtype([('src', '<i4'), ('dst', '<i4'), ('capacity', '<f4')])
+
+def calculate_capacity_tile(scenario, crds, rows, cols, bn, nf, txp, key, backend='numpy'):
+
+    """
+    :param scenario: 'apartment' or 'singlehouse'
+    :param crds: (n, 3) coordinate array of the nodes
+    :param rows: node ids of the tile rows
+    :param cols: node ids of the tile columns
+    :param bn: number of buildings (including both sides of the road)
+    :param nf: number of floors in each building
+    :param txp: trnsmission power of router
+    :param key: key of the shadowing draws, see shadowing.get_shadowing_key
+    :param backend: compute backend of the tile, see kernels.resolve_backend
+    :return: (len(rows) x len(cols)) link capacity tile, 0 where a node meets itself
+    """
+    return kernels.capacity_tile(scenario, crds, rows, cols, bn, nf, txp, key=key, backend=backend)
+
+def write_edge_records(edge_file, src, dst, capacity):
+
+    """
+    :param edge_file: open binary file of EDGE_DTYPE records
+    :return: number of records written
+    """
+    if edge_file is None:
+        return 0
+    rec = np.empty(len(src), dtype=EDGE_DTYPE)
+    rec['src'] = src
+    rec['dst'] = dst
+    rec['capacity'] = capacity
+    edge_file.write(rec.tobytes())
+    return len(rec)
+
+@instrumentation.instrument('tiled_capacity', count=lambda res: res[1])
+def tiled_link_capacity(scenario, sw, bw, bn, nf, fh, txp, thr=None, tile=2048, capacity_path=None, edge_path=None,
+                        dtype=np.float32, seed=None, backend='numpy'):
+
+    """
+    Computes distance, pathloss and capacity tile by tile over the upper triangle of the
+    pair space, so that peak memory is bounded by a few tile x tile arrays instead of n x n.
+
+    :param scenario: 'apartment' or 'singlehouse' (nf and fh are ignored for single houses)
+    :param sw: width of the street (in meter)
+    :param bw: width of a single building (in meter)
+    :param bn: number of buildings (including both sides of the road)
+    :param nf: number of floors in each building
+    :param fh: height of each floor
+    :param txp: trnsmission power of router
+    :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router), needed for edge_path
+    :param tile: number of nodes per row/column tile
+    :param capacity_path: if given, the full capacity matrix is written to this .npy file through a numpy.memmap
+    :param edge_path: if given, the edges above thr are appended to this file as EDGE_DTYPE records
+    :param dtype: floating point type of the memory-mapped capacity matrix
+    :param seed: seed of the shadowing draws, which are counter-based (see shadowing.py), so the
+                 capacities only depend on the seed and not on the tile size or the backend, and
+                 match those of the in-memory pipeline
+    :param backend: compute backend of the tiles, see kernels.resolve_backend. Without capacity_path
+                    the edges are thresholded inside the kernel and no capacity tile is kept
+    :return: (capacity memmap or None, number of edges written)
+    """
+    if scenario == 'singlehouse':
+        nf, fh = 1, 0
+    if edge_path is not None and thr is None:
+        sys.exit("A threshold is needed to write the edge file")
+    n = bn * nf
+    crds = coordinates.get_coordinate_array(coordinates.get_all_coordinates(sw, bw, bn, nf, fh))
+    key = shadowing.get_shadowing_key(seed)
+    backend = kernels.resolve_backend(backend)
+    cap_mm = None
+    if capacity_path is not None:
+        cap_mm = np.lib.format.open_memmap(capacity_path, mode='w+', dtype=dtype, shape=(n, n))
+    edge_file = open(edge_path, 'wb') if edge_path is not None else None
+    n_edges = 0
+    n_tiles = (n + tile - 1) // tile
+    try:
+        for ti in range(n_tiles):
+            rows = np.arange(ti * tile, min(n, (ti + 1) * tile))
+            for tj in range(ti, n_tiles):
+                cols = np.arange(tj * tile, min(n, (tj + 1) * tile))
+                if cap_mm is None:
+                    if edge_file is not None:
+                        li, lj, values = kernels.tile_edges(scenario, crds, rows, cols, bn, nf, txp, thr, key=key,
+                                                            upper=(ti == tj), backend=backend)
+                        n_edges += write_edge_records(edge_file, rows[li], cols[lj], values)
+                    continue
+                cap = calculate_capacity_tile(scenario, crds, rows, cols, bn, nf, txp, key, backend=backend)
+                cap_mm[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1] = cap
+                if ti != tj:
+                    cap_mm[cols[0]:cols[-1] + 1, rows[0]:rows[-1] + 1] = cap.T
+                if edge_file is not None:
+                    links = cap > thr
+                    if ti == tj:
+                        links = np.triu(links, 1)
+                    li, lj = np.nonzero(links)
+                    n_edges += write_edge_records(edge_file, rows[li], cols[lj], cap[li, lj])
+    finally:
+        if edge_file is not None:
+            edge_file.close()
+    if cap_mm is not None:
+        cap_mm.flush()
+    return cap_mm, n_edges
+
+def load_edge_file(edge_path, mmap=True):
+
+    """
+    :param edge_path: file written by tiled_link_capacity
+    :param mmap: if True, the records are memory-mapped instead of read into memory
+    :return: structured array of EDGE_DTYPE records with fields src, dst and capacity
+    """
+    if mmap:
+        return np.memmap(edge_path, dtype=EDGE_DTYPE, mode='r')
+    return np.fromfile(edge_path, dtype=EDGE_DTYPE)
+
+
+if __name__ == "__main__":
+
+    cap, n_edges = tiled_link_capacity('apartment', sw=20, bw=7, bn=400, nf=8, fh=3.5, txp=20, thr=0.0005,
+                                       tile=1024, edge_path='tiled_edges.bin', seed=1)
+    print("{} edges written to tiled_edges.bin".format(n_edges))
@@ -0,0 +1,136 @@
+import numpy as np
+import graph_ops
+import instrumentation
+from condensed import CondensedMatrix, condensed_index, condensed_size
+
+@instrumentation.instrument('spanning_tree', count=lambda tree: len(tree[0]))
+def maximum_spanning_tree(l_mat, threshold=0.0):
+
+    """
+    Maximum spanning forest of the links above threshold, with Prim's algorithm on the
+    dense capacity matrix: n steps of O(n) vector work, one row of l_mat at a time, so
+    the pairs are never copied into an edge list.
+
+    :param l_mat: CondensedMatrix of the link capacity between any two nodes
+    :param threshold: links at or below it are not usable
+    :return: (order, parent, weight) - the nodes in the order they joined the forest, the tree
+             parent of every node (-1 for the root of each component) and the capacity of the
+             link to that parent (0 for roots). A parent always joins before its children
+    """
+    n = l_mat.n
+    in_tree = np.zeros(n, dtype=bool)
+    best = np.full(n, -np.inf)
+    parent = np.full(n, -1, dtype=np.int64)
+    weight = np.zeros(n)
+    order = np.empty(n, dtype=np.int64)
+    for step in range(n):
+        v = int(np.argmax(best))
+        if best[v] <= threshold:
+            # nothing left is linked to the current component, v starts a new one
+            parent[v] = -1
+        else:
+            weight[v] = best[v]
+        order[step] = v
+        in_tree[v] = True
+        best[v] = -np.inf
+        row = l_mat.row(v)
+        better = (row > best) & ~in_tree
+        best[better] = row[better]
+        parent[better] = v
+    return order, parent, weight
+
+def relay_statistics(order, parent, weight):
+
+    """
+    :param order: node order of maximum_spanning_tree
+    :param parent: tree parent of every node
+    :param weight: capacity of the link to the parent
+    :return: dictionary with, for every node
+        component - id of its connected component
+        tree_degree - number of tree links, i.e. of widest paths leaving it in the first hop
+        relay_pairs - number of node pairs whose widest (tree) path passes through it as a relay
+        bottleneck_link - capacity of its weakest tree link, the limit on the traffic it can relay
+    """
+    n = len(order)
+    component = np.empty(n, dtype=np.int64)
+    size = np.ones(n, dtype=np.int64)
+    comp_id = -1
+    for v in order.tolist():
+        if parent[v] < 0:
+            comp_id += 1
+            component[v] = comp_id
+        else:
+            component[v] = component[parent[v]]
+    for v in order[::-1].tolist():
+        if parent[v] >= 0:
+            size[parent[v]] += size[v]
+    comp_size = np.bincount(component)[component]
+    has_parent = parent >= 0
+    children = parent[has_parent]
+
+    def pairs(m):
+        return m * (m - 1) // 2
+
+    # removing a node splits its component into its child subtrees and the part above it
+    child_pairs = np.bincount(children, weights=pairs(size[has_parent]), minlength=n).astype(np.int64)
+    above = comp_size - size
+    stats = {}
+    stats['component'] = component
+    stats['tree_degree'] = np.bincount(children, minlength=n) + has_parent
+    stats['relay_pairs'] = pairs(comp_size - 1) - child_pairs - pairs(above)
+    link = np.where(has_parent, weight, np.inf)
+    lowest_child = np.full(n, np.inf)
+    np.minimum.at(lowest_child, children, weight[has_parent])
+    bottleneck = np.minimum(link, lowest_child)
+    stats['bottleneck_link'] = np.where(np.isinf(bottleneck), 0, bottleneck)
+    return stats
+
+@instrumentation.instrument('widest_path', count=lambda res: len(res[0].data))
+def all_pairs_widest_path(l_mat, threshold=0.0, dtype=None, max_pairs=2**22):
+
+    """
+    Best multi-hop bottleneck capacity between every pair of nodes. The widest path
+    between two nodes runs along the maximum spanning tree, so its value is the
+    capacity at which Kruskal's algorithm first joins their components. The tree links
+    are replayed in descending order and every merge of components A and B writes its
+    capacity to the A x B block of the condensed result.
+
+    :param l_mat: CondensedMatrix of the link capacity between any two nodes
+    :param threshold: links at or below it are not usable, pairs that stay apart get 0
+    :param dtype: dtype of the result, that of l_mat if None (float32 halves it for large n)
+    :param max_pairs: upper bound on the pairs written at once
+    :return: (CondensedMatrix of the widest-path capacity, relay statistics of relay_statistics
+             plus mean_widest_path, the mean widest-path capacity from each node to the others)
+    """
+    n = l_mat.n
+    order, parent, weight = maximum_spanning_tree(l_mat, threshold)
+    out = np.zeros(condensed_size(n), dtype=dtype or l_mat.dtype)
+    total = np.zeros(n)
+    children = np.flatnonzero(parent >= 0)
+    children = children[np.argsort(-weight[children], kind='stable')]
+    uf = graph_ops.UnionFind(n)
+    members = {v: np.array([v]) for v in range(n)}
+    for v in children.tolist():
+        ra, rb = uf.find(v), uf.find(int(parent[v]))
+        a, b = members.pop(ra), members.pop(rb)
+        w = weight[v]
+        step = max(1, max_pairs // len(a))
+        for s in range(0, len(b), step):
+            out[condensed_index(n, a[:, None], b[None, s:s + step]).ravel()] = w
+        total[a] += w * len(b)
+        total[b] += w * len(a)
+        uf.union(ra, rb)
+        members[uf.find(ra)] = np.concatenate((a, b))
+    stats = relay_statistics(order, parent, weight)
+    stats['mean_widest_path'] = total / max(n - 1, 1)
+    return CondensedMatrix(out, n), stats
+
+
+if __name__ == "__main__":
+
+    import geometry_cache as gcache
+    l_mat = gcache.cached_link_capacity('apartment', sw=20, bw=7, bn=100, nf=8, fh=3.5, txp=20,
+                                        seed=1)
+    widest, stats = all_pairs_widest_path(l_mat, threshold=0.0005)
+    print("Mean widest-path capacity: {:.4f}, mean direct capacity: {:.4f}".format(widest.data.mean(), l_mat.data.mean()))
+    print("Busiest relay: node {} on {} paths".format(int(np.argmax(stats['relay_pairs'])), int(stats['relay_pairs'].max())))
@@ -1,7 +1,24 @@
 import numpy as np
 import coordinates
-
-def calculate_pathloss_for_residential_area(d, b):
+import graph_ops
+from condensed import CondensedMatrix, condensed_index, iter_pair_blocks
+import instrumentation
+import shadowing
+
+# street model of calculate_pathloss_for_residential_area (ITU-R P.1411-9 & ITU-R P.2109),
+# 10 * alpha and 10 * gamma are stored. kernels.py evaluates the same models with these names
+RESIDENTIAL_ALPHA = 21.2
+RESIDENTIAL_BETA = 29.2
+RESIDENTIAL_GAMMA = 21.1
+FREQUENCY_GHZ = 2.4
+BUILDING_ENTRY_LOSS = 15.0
+SHADOWING_SIGMA = 5.06
+# indoor model of calculate_pathloss_for_apartments (ITU-R P.1238-7)
+INDOOR_FREQUENCY_MHZ = 2400
+INDOOR_DISTANCE_COEFFICIENT = 28
+INDOOR_OFFSET = -18
+
+def calculate_pathloss_for_residential_area(d, b, ldb=None):
 
     """
     this model is based on ITU-R. We have assumed that wifi signal will operate at 2.4 GHz.
@@ -20,11 +37,13 @@ def calculate_pathloss_for_residential_area(d, b):
 
     These values are obtained from the following - ITU-R P.1411-9 &  ITU-R P.2109
 
+    :ldb: shadowing term N(0,sigma) in dB, drawn here when not given. d, b and ldb may be arrays of the same shape.
     :return: total path loss in in dB
     """
     try:
-        ldb = np.random.normal(loc=0, scale=5.06)
-        loss = (21.2 * np.log10(d)) + 29.2 + (21.1 * np.log(2.4)) + ldb +(b+1) * 15
+        if ldb is None:
+            ldb = np.random.normal(loc=0, scale=SHADOWING_SIGMA)
+        loss = (RESIDENTIAL_ALPHA * np.log10(d)) + RESIDENTIAL_BETA + (RESIDENTIAL_GAMMA * np.log(FREQUENCY_GHZ)) + ldb +(b+1) * BUILDING_ENTRY_LOSS
         return loss
     except ValueError as ex:
         print("Error in calculating total path loss for signle houses")
@@ -46,7 +65,7 @@ def calculate_pathloss_for_apartments(d):
     """
 
     try:
-        loss = (20 * np.log10(2400)) + (28 * np.log10(d)) - 18
+        loss = (20 * np.log10(INDOOR_FREQUENCY_MHZ)) + (INDOOR_DISTANCE_COEFFICIENT * np.log10(d)) + INDOOR_OFFSET
         return loss
     except ValueError as ex:
         print("Error in calculating total path loss in apartments")
@@ -70,6 +89,32 @@ def calculate_link_capacity(tx_power, pathloss):
         print("Error in calculating link capacity")
         print(ex)
 
+def calculate_max_pathloss(tx_power, threshold):
+
+    """
+    :param tx_power: power of Tx-antenna in dBm
+    :param threshold: it is the ratio of = video_bitrate/B (bandwidth of the router)
+    :return: largest pathloss in dB for which calculate_link_capacity still exceeds the threshold
+    """
+    return tx_power - 20 * np.log10(2**threshold - 1)
+
+@instrumentation.instrument('pathloss', count=np.size)
+def calculate_mean_pathloss(d, b, same_building):
+
+    """
+    :param d: distance of each pair of nodes (in meter)
+    :param b: number of buildings between the nodes of each pair
+    :param same_building: boolean array, True where both nodes are in the same building
+    :return: pathloss in dB of each pair without the shadowing term
+    """
+    d = np.asarray(d, dtype=float)
+    b = np.asarray(b)
+    same_building = np.asarray(same_building, dtype=bool)
+    pathloss = np.empty(d.shape)
+    pathloss[~same_building] = calculate_pathloss_for_residential_area(d[~same_building], b[~same_building], ldb=0)
+    pathloss[same_building] = calculate_pathloss_for_apartments(d[same_building])
+    return pathloss
+
 def calculate_building_intersection_matrix(bn, nf):
 
     """
@@ -77,45 +122,7 @@ def calculate_building_intersection_matrix(bn, nf):
     :param nf: number of floors in each building
     :return: number of buildings that lies between any two nodes
     """
-    total_nodes = bn * nf
-    node_eachside = int(total_nodes/2)
-    int_mat = [[0 for col in range(total_nodes)] for row in range(total_nodes)]
-    i = 0
-    while i < node_eachside:
-        j = i + 1
-        while j < node_eachside:
-            snode = i
-            dnode = j
-            s_id = int(snode / nf)
-            d_id = int(dnode / nf)
-            val = d_id - s_id - 1
-            if val < 0:
-                val = 0
-            int_mat[i][j] = val
-            j += 1
-        i += 1
-    for i in range(0, node_eachside):
-        for j in range(node_eachside, total_nodes):
-            int_mat[i][j] = 0
-    for i in range(node_eachside, total_nodes):
-        for j in range(0, node_eachside):
-            int_mat[i][j] = 0
-    for i in range(0, node_eachside):
-        for j in range(0, node_eachside):
-            if (i != j):
-                int_mat[j][i] = int_mat[i][j]
-    i = total_nodes-1
-    while i >= node_eachside:
-        j = total_nodes - 1
-        while j >= node_eachside:
-            int_mat[i][j] = int_mat[total_nodes -1 -i][total_nodes - 1 - j]
-            j = j - 1
-        i = i - 1
-    for i in range(node_eachside, total_nodes):
-        for j in range(node_eachside, total_nodes):
-            if (i != j):
-                int_mat[i][j] = int_mat[j][i]
-    return int_mat
+    return coordinates.get_intersection_matrix(bn, nf)
 
 def check_if_two_nodes_in_same_building(i, j, nf):
 
@@ -133,7 +140,58 @@ def check_if_two_nodes_in_same_building(i, j, nf):
         return False
 
 
-def calculate_pathloss_matrix(sw, bw, bn, nf, fh):
+# The square-matrix functions below are kept for callers that expect (n x n) arrays. They
+# run on the condensed pipeline and only expand the result, so they draw the same shadowing
+# as draw_condensed_shadowing and never build the (n x n) intermediates.
+
+def draw_shadowing_matrix(total_nodes, seed=None, nf=1):
+
+    """
+    :param total_nodes: total number of nodes
+    :param seed: seed of the draw ([MONTECARLO] Seed), fresh entropy if None
+    :param nf: number of floors in each building, pairs in the same building get no shadowing
+    :return: symmetric matrix of N(0, 5.06) shadowing values in dB, draw_condensed_shadowing as a square
+    """
+    return draw_condensed_shadowing(total_nodes, seed, nf).to_square()
+
+def calculate_mean_pathloss_matrix(dist_mat, int_mat, nf):
+
+    """
+    :param dist_mat: distance matrix between the nodes (in meter)
+    :param int_mat: building intersection matrix between the nodes
+    :param nf: number of floors in each building
+    :return: pathloss in dB between any two floors without the shadowing term
+    """
+    return calculate_condensed_mean_pathloss(CondensedMatrix.from_square(dist_mat), CondensedMatrix.from_square(int_mat),
+                                             nf).to_square()
+
+def calculate_pathloss_kernel(dist_mat, int_mat, nf, seed=None):
+
+    """
+    :param dist_mat: distance matrix between the nodes (in meter)
+    :param int_mat: building intersection matrix between the nodes
+    :param nf: number of floors in each building
+    :param seed: seed of the shadowing draw
+    :return: pathloss in dB between any two floors
+    """
+    pathloss = calculate_condensed_mean_pathloss(CondensedMatrix.from_square(dist_mat), CondensedMatrix.from_square(int_mat), nf)
+    pathloss.data += draw_condensed_shadowing(pathloss.n, seed, nf).data
+    return pathloss.to_square()
+
+def calculate_link_capacity_kernel(dist_mat, int_mat, nf, tx_power, seed=None):
+
+    """
+    :param dist_mat: distance matrix between the nodes (in meter)
+    :param int_mat: building intersection matrix between the nodes
+    :param nf: number of floors in each building
+    :param tx_power: tx power in dBm
+    :param seed: seed of the shadowing draw
+    :return: link capacity matrix, that contains link capacity between any two nodes
+    """
+    return calculate_condensed_link_capacity(CondensedMatrix.from_square(dist_mat), CondensedMatrix.from_square(int_mat),
+                                             nf, tx_power, seed).to_square()
+
+def calculate_pathloss_matrix(sw, bw, bn, nf, fh, seed=None):
 
     """
     :param sw: width of the street (in meter)
@@ -141,61 +199,100 @@ def calculate_pathloss_matrix(sw, bw, bn, nf, fh):
     :param bn: number of buildings (including both sides of the road)
     :param nf: number of floors in each building
     :param fh: height of each floor
+    :param seed: seed of the shadowing draw
     :return: pathloss in dB between any two floors
     """
-    total_nodes = bn * nf
     allc = coordinates.get_all_coordinates(sw, bw, bn, nf, fh)
-    dist_mat = coordinates.get_distance_matrix(allc)
-    int_mat = calculate_building_intersection_matrix(bn, nf)
-    pathloss_mat = [[0 for col in range(total_nodes)] for row in range(total_nodes)]
-    i = 0
-    while i < total_nodes:
-        j = i + 1
-        while j < total_nodes:
-            # if two nodes are in same building, apply pathloss model 2, otherwie
-            # apply pathloss model 1
-            if check_if_two_nodes_in_same_building(i, j, nf):
-                pathloss_mat[i][j] = calculate_pathloss_for_apartments(d=dist_mat[i][j])
-            else:
-                pathloss_mat[i][j] = calculate_pathloss_for_residential_area(d=dist_mat[i][j], b= int_mat[i][j])
-            j += 1
-        i += 1
-    for i in range(0, total_nodes):
-        for j in range(0, total_nodes):
-            if (i != j):
-                pathloss_mat[j][i] = pathloss_mat[i][j]
-    return pathloss_mat
+    dist_mat = coordinates.get_condensed_distance_matrix(allc)
+    int_mat = coordinates.get_condensed_intersection_matrix(bn, nf)
+    pathloss = calculate_condensed_mean_pathloss(dist_mat, int_mat, nf)
+    pathloss.data += draw_condensed_shadowing(dist_mat.n, seed, nf).data
+    return pathloss.to_square()
+
+@instrumentation.instrument('pathloss', count=lambda mat: len(mat.data))
+def calculate_condensed_mean_pathloss(dist_mat, int_mat, nf):
 
+    """
+    :param dist_mat: CondensedMatrix of the distances between the nodes (in meter)
+    :param int_mat: CondensedMatrix of the building intersections between the nodes
+    :param nf: number of floors in each building
+    :return: CondensedMatrix of the pathloss in dB between any two floors without the shadowing term
+    """
+    pathloss = np.empty(len(dist_mat.data))
+    for k0, k1, src, dst in iter_pair_blocks(dist_mat.n):
+        same_building = (src // nf) == (dst // nf)
+        pathloss[k0:k1] = calculate_mean_pathloss(dist_mat.data[k0:k1], int_mat.data[k0:k1], same_building)
+    return CondensedMatrix(pathloss, dist_mat.n)
+
+@instrumentation.instrument('shadowing', count=lambda mat: len(mat.data))
+def draw_condensed_shadowing(total_nodes, seed=None, nf=1):
+
+    """
+    :param total_nodes: total number of nodes
+    :param seed: seed of the draw ([MONTECARLO] Seed), fresh entropy if None
+    :param nf: number of floors in each building, pairs in the same building get no shadowing
+    :return: CondensedMatrix of N(0, 5.06) shadowing values in dB, one draw per pair of nodes
+             (see shadowing.py, the same values as pair_shadowing)
+    """
+    key = shadowing.get_shadowing_key(seed)
+    ldb = CondensedMatrix(SHADOWING_SIGMA * shadowing.range_normals(key, 0, total_nodes * (total_nodes - 1) // 2), total_nodes)
+    if nf > 1:
+        for k0, k1, src, dst in iter_pair_blocks(total_nodes):
+            ldb.data[k0:k1][(src // nf) == (dst // nf)] = 0
+    return ldb
+
+def pair_shadowing(key, n, src, dst, realization=0):
+
+    """
+    :param key: key of the draws, see shadowing.get_shadowing_key
+    :param n: total number of nodes
+    :param src: node id(s) of the first end
+    :param dst: node id(s) of the second end
+    :param realization: realization number(s) of a Monte Carlo run, broadcast against the pairs
+    :return: N(0, 5.06) shadowing values in dB of the pairs, whatever their order, equal to those
+             of draw_condensed_shadowing (pairs in the same building are not set to 0)
+    """
+    return SHADOWING_SIGMA * shadowing.pair_normals(key, condensed_index(n, src, dst), realization)
+
+def calculate_condensed_link_capacity(dist_mat, int_mat, nf, tx_power, seed=None):
+
+    """
+    :param dist_mat: CondensedMatrix of the distances between the nodes (in meter)
+    :param int_mat: CondensedMatrix of the building intersections between the nodes
+    :param nf: number of floors in each building
+    :param tx_power: tx power in dBm
+    :param seed: seed of the shadowing draw
+    :return: CondensedMatrix of the link capacity between any two nodes
+    """
+    pathloss = calculate_condensed_mean_pathloss(dist_mat, int_mat, nf)
+    pathloss.data += draw_condensed_shadowing(dist_mat.n, seed, nf).data
+    return calculate_link_capacity_matrix(pathloss, tx_power)
+
+@instrumentation.instrument('capacity', count=lambda mat: len(mat.data) if isinstance(mat, CondensedMatrix) else mat.size)
 def calculate_link_capacity_matrix(pathloss_mat, tx_power):
 
-    total_nodes = len(pathloss_mat)
-    link_capacity_mat = [[0 for col in range(total_nodes)] for row in range(total_nodes)]
-    for i in range(0, total_nodes):
-        for j in range(0, total_nodes):
-            if (i != j):
-                link_capacity_mat[i][j] = calculate_link_capacity(tx_power, pathloss_mat[i][j])
+    if isinstance(pathloss_mat, CondensedMatrix):
+        return CondensedMatrix(calculate_link_capacity(tx_power, pathloss_mat.data), pathloss_mat.n)
+    link_capacity_mat = calculate_link_capacity(tx_power, np.asarray(pathloss_mat, dtype=float))
+    np.fill_diagonal(link_capacity_mat, 0)
     return link_capacity_mat
 
+@instrumentation.instrument('edges', count=len)
 def create_graph_edges(n, lnk_mat, threshold):
 
     """
     :param n: no if users (here number of single houses)
-    :param lnk_mat: link capacity matrix
+    :param lnk_mat: link capacity matrix, square or CondensedMatrix
     :param threshold : it is the ratio of = video_bitrate/B (bandwidth of the router)
     :return: based on the link capacity matrix, it returns the tuples where an edge can be formed
     """
-    edge_list = []
-    for i in range(0,n):
-        for j in range(0, n):
-            if(lnk_mat[i][j]> threshold):
-                l = []
-                l.append(i)
-                l.append(j)
-                edge_list.append(tuple(l))
-    return edge_list
+    if not isinstance(lnk_mat, CondensedMatrix) or lnk_mat.n != n:
+        lnk_mat = CondensedMatrix.from_square(np.asarray(lnk_mat)[:n, :n])
+    adj = graph_ops.condensed_to_adjacency(lnk_mat, threshold)
+    return graph_ops.adjacency_to_edge_list(adj)
 
 
-def wireless_apartments_graph_info(sw, bw, bn, nf, fh, txp, thr):
+def wireless_apartments_graph_info(sw, bw, bn, nf, fh, txp, thr, as_sparse=False, weighted=False):
 
     """
     :param sw: width of the street (in meter)
@@ -206,12 +303,19 @@ def wireless_apartments_graph_info(sw, bw, bn, nf, fh, txp, thr):
     :param txp: trnsmission power of router
     :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router).
     if min reqd bitrate is - 700 kbps, B - 100 Mbps, then thr = 0.007
+    :param as_sparse: if True, return a scipy.sparse CSR adjacency matrix instead of the edge list
+    :param weighted: if True, the CSR adjacency matrix holds the link capacities as edge weights
     :return: list of edges of the graph of singlehouses
     """
 
-    pathlossmat = calculate_pathloss_matrix(sw, bw, bn, nf, fh)
-    l_mat = calculate_link_capacity_matrix(pathlossmat, tx_power=txp)
-    edge_list = create_graph_edges(bn*nf, l_mat, thr)
+    allc = coordinates.get_all_coordinates(sw, bw, bn, nf, fh)
+    dist_mat = coordinates.get_condensed_distance_matrix(allc)
+    int_mat = coordinates.get_condensed_intersection_matrix(bn, nf)
+    l_mat = calculate_condensed_link_capacity(dist_mat, int_mat, nf, tx_power=txp)
+    adj = graph_ops.condensed_to_adjacency(l_mat, thr, weighted=weighted)
+    if as_sparse:
+        return adj
+    edge_list = graph_ops.adjacency_to_edge_list(adj)
     return edge_list
 
 
@@ -1,7 +1,14 @@
 import numpy as np
 import sys
-from scipy.spatial import distance
 import math_ops
+import coordinates
+import graph_ops
+from wireless_apartments import RESIDENTIAL_ALPHA, RESIDENTIAL_BETA, RESIDENTIAL_GAMMA, FREQUENCY_GHZ, BUILDING_ENTRY_LOSS
+from condensed import CondensedMatrix
+import instrumentation
+
+# fixed shadowing term of the single-house model, in dB
+SINGLEHOUSE_SHADOWING = -4.12
 
 
 def calculate_pathloss_for_residential_area(d, b):
@@ -27,8 +34,8 @@ def calculate_pathloss_for_residential_area(d, b):
     """
     try:
         #ldb = np.random.normal(loc=0, scale=5.06)
-        ldb = -4.12
-        loss = (21.2 * np.log10(d)) + 29.2 + (21.1 * np.log(2.4)) + ldb +(b+1) * 15
+        ldb = SINGLEHOUSE_SHADOWING
+        loss = (RESIDENTIAL_ALPHA * np.log10(d)) + RESIDENTIAL_BETA + (RESIDENTIAL_GAMMA * np.log(FREQUENCY_GHZ)) + ldb +(b+1) * BUILDING_ENTRY_LOSS
         return loss
     except ValueError as ex:
         print("Error in calculating total path loss for signle houses")
@@ -62,33 +69,10 @@ def calculate_distance_matrix(sw, bw, bn):
     :return: calculate and return a 2D array/matrix that contains the distance between any two houses (in meter)
     """
 
-    distance_mat = [[0 for col in range(bn)] for row in range(bn)]
-    bn_eachside = int(bn/2)  # number of buildings on eaach side of the road
-    xcords = [float(bw)/2]  # taking the coordinates of the centers only
-    j = 1
-    while(j < bn_eachside):
-        xcords.append(xcords[j - 1] + bw)
-        j += 1
-    for i in range(len(xcords)):
-        xcords.append(xcords[i])
-    ycords = [0] * bn_eachside
-    for j in range(bn_eachside):
-        val = sw + bw   # assuming buildings are square, so building length = building width
-        ycords.append(float(val))
-    count = 0
-    while count < bn:
-        j = count + 1
-        while j < bn:
-            a = (xcords[count], ycords[count])
-            b = (xcords[j], ycords[j])
-            distance_mat[count][j] = round(distance.euclidean(a, b),2)
-            j += 1
-        count += 1
-    for i in range(0, bn):
-        for j in range(0, bn):
-            if (i != j):
-                distance_mat[j][i] = distance_mat[i][j]
-    return distance_mat
+    # single houses are the one-floor case of the apartment street layout,
+    # all routers at ground level
+    allc = coordinates.get_all_coordinates(sw, bw, bn, nf=1, fh=0)
+    return coordinates.get_distance_matrix(allc)
 
 
 def calculate_building_intersection_matrix(bn):
@@ -98,36 +82,9 @@ def calculate_building_intersection_matrix(bn):
     :return: matrix of number of buildings between any two building
     """
 
-    int_mat = [[0 for col in range(bn)] for row in range(bn)]
-    bn_eachside = int(bn/2)
-    i = 0
-    while i < (bn_eachside - 1):
-        j = i + 2
-        bval = 1
-        while j < bn_eachside:
-            int_mat[i][j] = bval
-            bval += 1
-            j += 1
-        i += 1
-    for i in range(0, bn_eachside):
-        for j in range(0, bn_eachside):
-            if (i != j):
-                int_mat[j][i] = int_mat[i][j]
-    i = bn_eachside
-    while i < (bn - 1):
-        j = i + 2
-        bval = 1
-        while j < bn:
-            int_mat[i][j] = bval
-            bval += 1
-            j += 1
-        i += 1
-    for i in range(bn_eachside, bn):
-        for j in range(bn_eachside, bn):
-            if (i != j):
-                int_mat[j][i] = int_mat[i][j]
-    return int_mat
+    return coordinates.get_intersection_matrix(bn, nf=1)
 
+@instrumentation.instrument('capacity', count=np.size)
 def calculate_link_capacity_matrix(dist_mat, intersection_mat, tx_power):
 
     """
@@ -144,37 +101,41 @@ def calculate_link_capacity_matrix(dist_mat, intersection_mat, tx_power):
     elif(math_ops.num_rows(dist_mat)!= math_ops.num_rows(intersection_mat)):
         sys.exit("The dimensions of distance and interseection matrix do not match")
     else:
-        n_house = math_ops.num_rows(dist_mat)
-        link_capacity_matrix = [[0 for col in range(n_house)] for row in range(n_house)]
-        for i in range(0, n_house):
-            for j in range(i+1, n_house):
-                pl = calculate_pathloss_for_residential_area(dist_mat[i][j], intersection_mat[i][j])
-                link_capacity_matrix[i][j] = calculate_link_capacity(tx_power, pl)
-        for i in range(0, n_house):
-            for j in range(i+1, n_house):
-                link_capacity_matrix[j][i] = link_capacity_matrix[i][j]
+        with np.errstate(divide='ignore'):
+            pl = calculate_pathloss_for_residential_area(np.asarray(dist_mat, dtype=float), np.asarray(intersection_mat))
+        link_capacity_matrix = calculate_link_capacity(tx_power, pl)
+        np.fill_diagonal(link_capacity_matrix, 0)
         return link_capacity_matrix
 
+@instrumentation.instrument('capacity', count=lambda mat: len(mat.data))
+def calculate_condensed_link_capacity(dist_mat, intersection_mat, tx_power):
+
+    """
+    :param dist_mat: CondensedMatrix of the distances between the houses
+    :param intersection_mat: CondensedMatrix of the building intersections between the houses
+    :param tx_power: tx power in dBm
+    :return: CondensedMatrix of the link capacity between any two houses
+    """
+    if dist_mat.n != intersection_mat.n:
+        sys.exit("The dimensions of distance and interseection matrix do not match")
+    pl = calculate_pathloss_for_residential_area(dist_mat.data, intersection_mat.data)
+    return CondensedMatrix(calculate_link_capacity(tx_power, pl), dist_mat.n)
+
+@instrumentation.instrument('edges', count=len)
 def create_graph_edges(n, lnk_mat, threshold):
 
     """
     :param n: no if users (here number of single houses)
-    :param lnk_mat: link capacity matrix
+    :param lnk_mat: link capacity matrix, square or CondensedMatrix
     :param threshold : it is the ratio of = video_bitrate/B (bandwidth of the router)
     :return: based on the link capacity matrix, it returns the tuples where an edge can be formed
     """
-    edge_list = []
-    for i in range(0,n):
-        for j in range(0, n):
-            if(i>j):
-                if(lnk_mat[i][j]> threshold):
-                    l = []
-                    l.append(i)
-                    l.append(j)
-                    edge_list.append(tuple(l))
-    return edge_list
+    if not isinstance(lnk_mat, CondensedMatrix) or lnk_mat.n != n:
+        lnk_mat = CondensedMatrix.from_square(np.asarray(lnk_mat)[:n, :n])
+    adj = graph_ops.condensed_to_adjacency(lnk_mat, threshold)
+    return graph_ops.adjacency_to_edge_list(adj, lower_only=True)
 
-def wireless_singlehouse_graph_info(sw, bw, bn, txp, thr):
+def wireless_singlehouse_graph_info(sw, bw, bn, txp, thr, as_sparse=False, weighted=False):
 
     """
     :param sw: width of the street (in meter)
@@ -183,13 +144,19 @@ def wireless_singlehouse_graph_info(sw, bw, bn, txp, thr):
     :param txp: trnsmission power of router
     :param thr: threshold, it is the ratio of = video_bitrate/B (bandwidth of the router).
     if min reqd bitrate is - 700 kbps, B - 100 Mbps, then thr = 0.007
+    :param as_sparse: if True, return a scipy.sparse CSR adjacency matrix instead of the edge list
+    :param weighted: if True, the CSR adjacency matrix holds the link capacities as edge weights
     :return: list of edges of the graph of singlehouses
     """
 
-    dst_mat = calculate_distance_matrix(sw=sw, bw=bw, bn=bn)
-    ints_mat = calculate_building_intersection_matrix(bn=bn)
-    l_mat = calculate_link_capacity_matrix(dst_mat, ints_mat, tx_power=txp)
-    edge_list = create_graph_edges(bn, l_mat, thr)
+    allc = coordinates.get_all_coordinates(sw, bw, bn, nf=1, fh=0)
+    dst_mat = coordinates.get_condensed_distance_matrix(allc)
+    ints_mat = coordinates.get_condensed_intersection_matrix(bn)
+    l_mat = calculate_condensed_link_capacity(dst_mat, ints_mat, tx_power=txp)
+    adj = graph_ops.condensed_to_adjacency(l_mat, thr, weighted=weighted)
+    if as_sparse:
+        return adj
+    edge_list = graph_ops.adjacency_to_edge_list(adj, lower_only=True)
     return edge_list
 
 